@@ -5,18 +5,2614 @@ import logging
 import re
 import os
 import socket
-from typing import List, Dict
+import json
+import csv
+import heapq
+import bisect
+import hashlib
+import itertools
+import threading
+import selectors
+import errno
+import queue
+import functools
+import enum
+from abc import ABC, abstractmethod
+from collections import deque
+import sqlite3
+import mmap
+import ipaddress
+import cProfile
+import pstats
+import random
+import secrets
+import argparse
+import http.server
+import asyncio
+import ssl
+from urllib.parse import urlsplit, urljoin, urlunsplit, parse_qsl, urlencode, quote
+from typing import List, Dict, Iterator
 import sys
-import requests.packages.urllib3.util.connection as urllib3_connection
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# 热路径上用到的正则，模块加载时编译一次
+IPV6_PATTERN = re.compile(r'[0-9a-fA-F:]+:[0-9a-fA-F:]+')
+IPV4_HOST_PATTERN = re.compile(r'^\d+\.\d+\.\d+\.\d+$')
+PLACEHOLDER_PATTERN = re.compile(r'\{(?::([^{}]*))?\}')
+ZERO_PAD_PATTERN = re.compile(r'0(\d+)d?')
+EXTINF_NAME_PATTERN = re.compile(r'#EXTINF:.*?,(.+?)\n')
+GENERIC_NAME_PATTERN = re.compile(r'^(频道|Channel_?)\d+$', re.IGNORECASE)
+INVALID_NAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+PLTV_ID_PATTERN = re.compile(r'322122(\d+)/1\.m3u8')
+CONNECT_IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                       getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)}
+NUMERIC_ID_PATTERN = re.compile(r'/(\d+)/[^/]*\.m3u8')
+STREAM_INF_PATTERN = re.compile(r'#EXT-X-STREAM-INF:([^\r\n]*)\s+([^#\s][^\r\n]*)')
+BANDWIDTH_PATTERN = re.compile(r'(?<![-\w])BANDWIDTH=(\d+)')
+SEGMENT_PATTERN = re.compile(r'#EXTINF:\s*([\d.]+)[^\r\n]*\s+(?:#[^\r\n]*\s+)*([^#\s][^\r\n]*)')
+SEGMENT_LINE_PATTERN = re.compile(rb'#EXTINF[^\n]*\n(?:\s*#[^\n]*\n|\s*\n)*\s*[^#\s][^\n]*\n')
+TARGET_DURATION_PATTERN = re.compile(r'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)')
+MEDIA_SEQUENCE_PATTERN = re.compile(r'#EXT-X-MEDIA-SEQUENCE:\s*(\d+)')
+TIMESTAMP_PATTERN = re.compile(r'(?<!\d)1[5-9]\d{8}(?:\d{3})?(?!\d)')  # 秒或毫秒级Unix时间戳
+
+
+def url_authority(url: str) -> str:
+    """URL中的主机和端口部分（不含用户信息）"""
+    return url.partition('://')[2].partition('/')[0].rpartition('@')[2]
+
+
+def find_ipv6(authority: str):
+    """在主机部分中查找IPv6地址；IPv6至少有两个冒号，因此IPv4:端口不会被误判"""
+    if authority.count(':') < 2:
+        return None
+    return IPV6_PATTERN.search(authority)
+
+
+def content_size(headers, read: int) -> int:
+    """响应对应的完整内容长度：206响应取Content-Range中的总长度，其次Content-Length，都没有时为已读取的字节数"""
+    total = headers.get('content-range', '').rpartition('/')[2]
+    if total.isdigit():
+        return int(total)
+    length = headers.get('content-length', '')
+    return int(length) if length.isdigit() else read
+
+
+@functools.lru_cache(maxsize=1024)
+def host_ip_version(hostname: str, network_mode: str) -> str:
+    """按主机名判断IP版本，结果缓存"""
+    if not hostname:
+        return "Unknown"
+    # 检查是否是IPv6地址（urlsplit返回的主机名已去掉方括号）
+    if hostname.count(':') >= 2:
+        return "IPv6"
+    # 检查是否是IPv4地址
+    if IPV4_HOST_PATTERN.match(hostname):
+        return "IPv4"
+    # 域名，根据当前网络模式判断
+    return network_mode.upper()
+
+
+class URLTemplate:
+    """
+    扫描开始前把基础URL解析一次：拆成ID前后的固定部分，预先处理IPv6方括号、
+    零填充规则（如{:05d}）和IP版本，之后每个ID只需要一次字符串拼接
+    """
+    __slots__ = ('base_url', 'prefix', 'suffix', 'width', 'format_spec', 'host', 'ip_version', 'error')
+
+    def __init__(self, base_url: str, network_mode: str = "dual_stack"):
+        self.base_url = base_url
+        self.error = ''
+        match = PLACEHOLDER_PATTERN.search(base_url)
+        if not match:
+            raise ValueError(f"URL中必须包含 {{}} 来表示ID位置: {base_url}")
+        prefix = base_url[:match.start()].replace('{{', '{').replace('}}', '}')
+        self.suffix = base_url[match.end():].replace('{{', '{').replace('}}', '}')
+        
+        # 零填充和其它格式说明
+        spec = match.group(1) or ''
+        pad = ZERO_PAD_PATTERN.fullmatch(spec)
+        self.width = int(pad.group(1)) if pad else 0
+        self.format_spec = '' if pad else spec
+        
+        # 裸IPv6地址补上方括号
+        authority = url_authority(prefix + '0' + self.suffix)
+        ipv6_match = find_ipv6(authority)
+        if ipv6_match and '[' not in authority and ']' not in authority:
+            ipv6_addr = ipv6_match.group(0)
+            prefix = prefix.replace(ipv6_addr, f'[{ipv6_addr}]', 1)
+            authority = authority.replace(ipv6_addr, f'[{ipv6_addr}]', 1)
+        if ipv6_match and ('[' not in authority or ']' not in authority):
+            self.error = 'IPv6地址格式错误，缺少方括号'
+        self.prefix = prefix
+        
+        try:
+            self.host = urlsplit(self.render(0)).hostname or ''
+        except ValueError:
+            self.host = ''
+        self.ip_version = host_ip_version(self.host, network_mode)
+
+    def render(self, id_num: int) -> str:
+        """生成某个ID的完整URL"""
+        if self.width:
+            return self.prefix + str(id_num).zfill(self.width) + self.suffix
+        if self.format_spec:
+            return self.prefix + format(id_num, self.format_spec) + self.suffix
+        return self.prefix + str(id_num) + self.suffix
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_url(url: str, keep_params: frozenset = None) -> str:
+    """
+    URL去重用的规范形式：协议和主机名小写、去掉默认端口和#片段、查询参数排序，
+    裸IPv6地址按generate_url的规则补上方括号并压缩表示
+    :param keep_params: 只保留这些查询参数（如带时间戳、签名的地址），None为全部保留
+    """
+    url = url.strip()
+    authority = url_authority(url)
+    ipv6_match = find_ipv6(authority)
+    if ipv6_match and '[' not in authority:
+        ipv6_addr = ipv6_match.group(0)
+        url = url.replace(ipv6_addr, f'[{ipv6_addr}]', 1)
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if ':' in host:
+        try:
+            host = ipaddress.ip_address(host).compressed
+        except ValueError:
+            pass
+        host = f'[{host}]'
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc += f':{port}'
+    userinfo = parts.netloc.rpartition('@')[0]
+    if userinfo:
+        netloc = f'{userinfo}@{netloc}'
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if keep_params is not None:
+        params = [(key, value) for key, value in params if key in keep_params]
+    query = urlencode(sorted(params), quote_via=quote, safe='/:@')
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def uri_template(uri: str, sequence: str = '', base_url: str = '') -> str:
+    """
+    分片URI的模板：先按播放列表地址解析相对URI，保留主机和路径，去掉协议和查询参数（多为会话令牌），
+    媒体序号和时间戳换成占位符；不同ID下同名的相对分片（如 1.ts）解析后路径不同，不会得到相同的模板
+    """
+    parts = urlsplit(urljoin(base_url, uri.strip()))
+    path = parts.path
+    if sequence and sequence in path:
+        head, _, tail = path.rpartition(sequence)
+        path = f"{head}{{seq}}{tail}"
+    return parts.netloc.lower() + TIMESTAMP_PATTERN.sub('{t}', path)
+
+
+def playlist_fingerprint(content: str, probed_at: float, url: str = ''):
+    """
+    根据探测时已读取的播放列表正文计算内容指纹，不需要额外请求：
+    媒体播放列表取 目标时长 + 第一个分片按url解析后的主机和路径模板；
+    主播放列表只有码率和子流名称（常见的 1.m3u8?token=... 在不同频道间完全相同），不计算指纹
+    另返回序号偏移 = 媒体序号 - 探测时间/目标时长：同一路直播在不同地址上的偏移基本一致，
+    用来区分分片命名相同、但进度不同的流（例如同一源站上按序号命名分片的不同频道）
+    :return: (指纹, 序号偏移)；主播放列表或正文中没有分片信息时返回('', '')
+    """
+    if STREAM_INF_PATTERN.search(content):
+        return '', ''
+    
+    segment = SEGMENT_PATTERN.search(content)
+    if not segment:
+        return '', ''
+    duration = TARGET_DURATION_PATTERN.search(content)
+    sequence = MEDIA_SEQUENCE_PATTERN.search(content)
+    target_duration = duration.group(1) if duration else ''
+    sequence = sequence.group(1) if sequence else ''
+    key = f"{target_duration}|{uri_template(segment.group(2), sequence, url)}"
+    offset = ''
+    if sequence and target_duration and float(target_duration) > 0:
+        offset = round(int(sequence) - probed_at / float(target_duration), 1)
+    return hashlib.sha1(key.encode()).hexdigest()[:16], offset
+
+
+def stream_speed_key(record: Dict):
+    """地址的速度排序键：有深度检测结果时按实测速度，否则按响应时间"""
+    return -(record.get('throughput') or 0), record.get('response_time') or 0
+
+
+def group_streams(records: Iterator[Dict], window: float = 3.0) -> List[List[Dict]]:
+    """
+    按内容指纹把同一路流的不同ID/镜像地址分成一组：指纹相同且序号偏移相差不超过window个分片
+    每组按速度排序，第一个为主地址，其余为备用地址；没有指纹的记录单独成组
+    """
+    groups = []
+    by_fingerprint = {}
+    for record in records:
+        if record.get('fingerprint'):
+            by_fingerprint.setdefault(record['fingerprint'], []).append(record)
+        else:
+            groups.append([record])
+    for members in by_fingerprint.values():
+        members.sort(key=lambda record: (record.get('seq_offset') in ('', None), record.get('seq_offset') or 0))
+        clusters = []
+        for record in members:
+            offset = record.get('seq_offset')
+            if clusters:
+                first = clusters[-1][0].get('seq_offset')
+                if offset in ('', None) or first in ('', None) or abs(offset - first) <= window:
+                    clusters[-1].append(record)
+                    continue
+            clusters.append([record])
+        groups.extend(clusters)
+    for group in groups:
+        group.sort(key=stream_speed_key)
+    return groups
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """已排序列表的百分位数，空列表返回0"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+class HostResolver:
+    """按主机缓存DNS解析结果，并按Happy Eyeballs (RFC 8305) 交替尝试IPv6/IPv4地址建立连接，两个引擎共用"""
+
+    families = {"ipv4": socket.AF_INET, "ipv6": socket.AF_INET6, "dual_stack": socket.AF_UNSPEC}
+
+    def __init__(self, network_mode: str = "dual_stack", ttl: float = 300, negative_ttl: float = 30,
+                 attempt_delay: float = 0.25):
+        self.family = self.families.get(network_mode, socket.AF_UNSPEC)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.attempt_delay = attempt_delay
+        self.metrics = None
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}  # (主机, 端口, 地址族) -> (过期时间, 地址列表或解析异常)
+        self._winners = {}  # 主机 -> 最近一次连接成功使用的地址族
+        self._pinned = {}  # 主机 -> 单独指定的地址族（批量任务按任务设置网络模式）
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def set_mode(self, network_mode: str):
+        self.family = self.families.get(network_mode, socket.AF_UNSPEC)
+
+    def pin(self, host: str, network_mode: str):
+        """为单个主机指定网络模式，覆盖全局设置"""
+        self._pinned[host] = self.families.get(network_mode, socket.AF_UNSPEC)
+
+    def family_for(self, host: str) -> int:
+        return self._pinned.get(host, self.family)
+
+    def resolve(self, host: str, port: int) -> List[tuple]:
+        """
+        解析主机，返回按Happy Eyeballs顺序排列的[(地址族, sockaddr)]；解析失败抛出socket.gaierror
+        同一主机同时只有一个线程真正发起解析，其它线程等待结果
+        """
+        family = self.family_for(host)
+        key = (host, port, family)
+        entry = self._cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return self._cached(entry)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                return self._cached(entry)
+            with self._lock:
+                self.misses += 1
+            start_time = time.time()
+            try:
+                infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+            except socket.gaierror as e:
+                self._cache[key] = (time.monotonic() + self.negative_ttl, e)
+                raise
+            finally:
+                if self.metrics:
+                    self.metrics.observe('dns', time.time() - start_time)
+            addresses = self.interleave([(info[0], info[4]) for info in infos])
+            self._cache[key] = (time.monotonic() + self.ttl, addresses)
+            return addresses
+
+    def _cached(self, entry):
+        with self._lock:
+            self.hits += 1
+        if isinstance(entry[1], Exception):
+            raise entry[1]
+        return entry[1]
+
+    async def resolve_async(self, host: str, port: int) -> List[tuple]:
+        """resolve的asyncio版本：命中缓存时直接返回，否则在线程池中解析"""
+        entry = self._cache.get((host, port, self.family_for(host)))
+        if entry and entry[0] > time.monotonic():
+            return self._cached(entry)
+        return await asyncio.get_running_loop().run_in_executor(None, self.resolve, host, port)
+
+    @staticmethod
+    def interleave(addresses: List[tuple]) -> List[tuple]:
+        """去重后按 IPv6、IPv4、IPv6... 交替排列（RFC 8305 第4节）"""
+        addresses = list(dict.fromkeys(addresses))
+        ipv6 = [address for address in addresses if address[0] == socket.AF_INET6]
+        ipv4 = [address for address in addresses if address[0] != socket.AF_INET6]
+        ordered = []
+        for pair in itertools.zip_longest(ipv6, ipv4):
+            ordered.extend(address for address in pair if address)
+        return ordered
+
+    def connect(self, address: tuple, timeout=None, source_address=None, socket_options=None) -> socket.socket:
+        """解析并以Happy Eyeballs方式建立TCP连接，替代urllib3的create_connection"""
+        host, port = address
+        host = host.strip('[]')
+        if not isinstance(timeout, (int, float)):
+            timeout = None
+        deadline = time.monotonic() + timeout if timeout else None
+        remaining = deque(self.resolve(host, port))
+        selector = selectors.DefaultSelector()
+        error = None
+        next_attempt = 0.0
+        try:
+            while remaining or selector.get_map():
+                now = time.monotonic()
+                if deadline and now >= deadline:
+                    raise socket.timeout(f"连接 {host} 超时")
+                if remaining and (not selector.get_map() or now >= next_attempt):
+                    family, sockaddr = remaining.popleft()
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    try:
+                        for option in socket_options or ():
+                            sock.setsockopt(*option)
+                        if source_address:
+                            sock.bind(source_address)
+                        sock.setblocking(False)
+                        code = sock.connect_ex(sockaddr)
+                        if code not in CONNECT_IN_PROGRESS:
+                            raise OSError(code, os.strerror(code))
+                    except OSError as e:
+                        sock.close()
+                        error = e
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE, family)
+                    next_attempt = now + self.attempt_delay
+                
+                waits = [deadline - now] if deadline else []
+                if remaining:
+                    waits.append(next_attempt - now)
+                for key, _ in selector.select(max(0.0, min(waits)) if waits else None):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if code:
+                        sock.close()
+                        error = OSError(code, os.strerror(code))
+                        # 失败时立即尝试下一个地址，不必等满间隔
+                        next_attempt = 0.0
+                        continue
+                    sock.settimeout(timeout)
+                    self._winners[host] = key.data
+                    return sock
+            raise error or OSError(f"没有可用的地址: {host}")
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+    async def open_connection(self, host: str, port: int, ssl_context=None):
+        """connect的asyncio版本，返回(reader, writer)"""
+        remaining = deque(await self.resolve_async(host, port))
+        server_hostname = host if ssl_context else None
+        pending = set()
+        error = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    family, sockaddr = remaining.popleft()
+                    attempt = asyncio.ensure_future(asyncio.open_connection(
+                        sockaddr[0], sockaddr[1], family=family, ssl=ssl_context, server_hostname=server_hostname))
+                    attempt.family = family
+                    pending.add(attempt)
+                done, pending = await asyncio.wait(pending, timeout=self.attempt_delay if remaining else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for attempt in done:
+                    if attempt.exception() is not None:
+                        error = attempt.exception()
+                    elif winner is None:
+                        winner = attempt
+                    else:
+                        attempt.result()[1].close()
+                if winner:
+                    self._winners[host] = winner.family
+                    return winner.result()
+            raise error or OSError(f"没有可用的地址: {host}")
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+
+    def ip_version(self, host: str) -> str:
+        """主机最近一次连接实际使用的IP版本，还没有连接过时返回空字符串"""
+        family = self._winners.get(host)
+        if family is None:
+            return ''
+        return "IPv6" if family == socket.AF_INET6 else "IPv4"
+
+
+class ResolvingConnectionMixin:
+    """urllib3连接类的混入：用HostResolver建立连接，替代全局的create_connection"""
+    resolver = None
+
+    def _new_conn(self):
+        try:
+            return self.resolver.connect((self._dns_host, self.port), self.timeout,
+                                         self.source_address, self.socket_options)
+        except socket.gaierror as e:
+            raise NewConnectionError(self, f"Failed to resolve '{self.host}' ({e})") from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})") from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+
+class ResolvingHTTPAdapter(HTTPAdapter):
+    """只对本Session生效的连接适配器：连接池使用带DNS缓存和Happy Eyeballs的连接类"""
+
+    def __init__(self, resolver: HostResolver, **kwargs):
+        self.resolver = resolver
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+        for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items():
+            connection_cls = type(f"Resolving{pool_cls.ConnectionCls.__name__}",
+                                  (ResolvingConnectionMixin, pool_cls.ConnectionCls), {'resolver': self.resolver})
+            pool_classes[scheme] = type(f"Resolving{pool_cls.__name__}", (pool_cls,), {'ConnectionCls': connection_cls})
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def __setstate__(self, state):
+        # HTTPAdapter反序列化时会调用init_poolmanager
+        self.resolver = state.pop('resolver', None) or HostResolver()
+        super().__setstate__(state)
+
+
+class AtomicFile:
+    """先写入 "目标文件.tmp"，commit时原子替换目标文件，写到一半崩溃时原文件保持完整"""
+
+    def __init__(self, filepath: str, encoding: str = 'utf-8', newline: str = None):
+        self.filepath = filepath
+        self.tmp_path = filepath + '.tmp'
+        self.file = open(self.tmp_path, 'w', encoding=encoding, newline=newline)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.filepath)
+
+    def discard(self):
+        """放弃写入的内容，目标文件保持不变"""
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.discard()
+        else:
+            self.commit()
+
+
+def atomic_write(filepath: str, text: str):
+    """把text原子写入文件（见AtomicFile）"""
+    with AtomicFile(filepath) as f:
+        f.write(text)
+
+
+class ResultSink(ABC):
+    """增量结果写入器：每确认一个有效频道就立即追加写入磁盘，内存中不保留结果"""
+
+    # 写入磁盘的字段（不包含M3U8正文）
+    fields = ['id', 'url', 'channel_name', 'response_time', 'content_type',
+              'content_length', 'ip_version', 'bandwidth', 'throughput', 'fingerprint', 'seq_offset']
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def open(self, append: bool = False):
+        """打开结果文件，append=True时在已有结果后继续追加"""
+        exists = append and os.path.exists(self.filepath)
+        if exists:
+            self.count = sum(1 for _ in self)
+        self._file = open(self.filepath, 'a' if append else 'w', encoding='utf-8', newline='')
+        if not exists:
+            self._write_header()
+        return self
+
+    def write(self, result: Dict):
+        """追加一条结果并立即刷新，崩溃时已写入的结果不会丢失"""
+        record = {key: result.get(key, '') for key in self.fields}
+        with self._lock:
+            self._write_record(record)
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def rewrite(self, records):
+        """用新的记录替换整个结果文件（见AtomicFile），records可以是从本文件读出的迭代器"""
+        tmp_sink = type(self)(self.filepath)
+        with AtomicFile(self.filepath, newline='') as f:
+            tmp_sink._file = f
+            tmp_sink._write_header()
+            for record in records:
+                tmp_sink.write(record)
+        self.count = tmp_sink.count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self) -> Iterator[Dict]:
+        """从磁盘逐条读回结果"""
+        if not os.path.exists(self.filepath):
+            return
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as f:
+            yield from self._read_records(f)
+
+    def _write_header(self):
+        """新文件开头的内容，默认没有"""
+
+    @abstractmethod
+    def _write_record(self, record: Dict):
+        """把一条记录写入已打开的文件"""
+
+    @abstractmethod
+    def _read_records(self, f) -> Iterator[Dict]:
+        """从已打开的文件逐条读出记录"""
+
+
+class JsonlResultSink(ResultSink):
+    """JSON Lines格式，每行一个频道"""
+    extension = '.jsonl'
+
+    def _write_record(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _read_records(self, f) -> Iterator[Dict]:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 崩溃时最后一行可能只写了一半
+                continue
+
+
+class CsvResultSink(ResultSink):
+    """CSV格式，首行为表头"""
+    extension = '.csv'
+
+    def _write_header(self):
+        csv.writer(self._file).writerow(self.fields)
+
+    def _write_record(self, record: Dict):
+        csv.writer(self._file).writerow([record[key] for key in self.fields])
+
+    def _read_records(self, f) -> Iterator[Dict]:
+        for row in csv.DictReader(f):
+            if row.get('url') is None:
+                continue
+            row['id'] = int(row['id'])
+            row['response_time'] = float(row['response_time'] or 0)
+            row['content_length'] = int(row['content_length'] or 0)
+            row['bandwidth'] = int(row.get('bandwidth') or 0)
+            row['throughput'] = int(row.get('throughput') or 0)
+            row['seq_offset'] = float(row['seq_offset']) if row.get('seq_offset') else ''
+            yield row
+
+
+RESULT_SINKS = {
+    'jsonl': JsonlResultSink,
+    'csv': CsvResultSink,
+}
+
+
+GENRE_SUFFIX = ',#genre#'
+GROUP_TITLE_PATTERN = re.compile(r'group-title="([^"]*)"')
+USER_AGENT_PREFIX = 'ua='
+
+
+class PlaylistEntry:
+    """
+    直播源列表中的一个频道条目；分组名和UA经过intern，同组条目共享同一个字符串
+    extinf/options只在M3U格式中有值（原#EXTINF行和其后的#EXTVLCOPT等指令行）
+    """
+    __slots__ = ('name', 'url', 'group', 'user_agent', 'line_no', 'extinf', 'options')
+
+    def __init__(self, name: str, url: str, group: str = '', user_agent: str = '', line_no: int = 0,
+                 extinf: str = '', options: tuple = ()):
+        self.name = name
+        self.url = url
+        self.group = group
+        self.user_agent = user_agent
+        self.line_no = line_no
+        self.extinf = extinf
+        self.options = options
+
+    def __repr__(self):
+        return f"PlaylistEntry({self.name!r}, {self.url!r}, group={self.group!r})"
+
+
+class PlaylistReader:
+    """
+    单遍流式读取 "名称,URL" 格式（"分组,#genre#" 分组、"ua=..." 指定后续条目的UA）
+    或 #EXTM3U 格式的直播源列表；迭代时逐行读取文件并逐个产出PlaylistEntry，不整体载入内存
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.format = 'txt'
+        self.header = ''  # M3U的#EXTM3U行（可能带x-tvg-url等属性）
+        with open(filepath, 'r', encoding='utf-8-sig', errors='replace') as f:
+            for line in f:
+                text = line.strip()
+                if text:
+                    if text[:7].upper() == '#EXTM3U':
+                        self.format = 'm3u'
+                        self.header = text
+                    break
+
+    def __iter__(self) -> Iterator[PlaylistEntry]:
+        with open(self.filepath, 'r', encoding='utf-8-sig', errors='replace') as f:
+            if self.format == 'm3u':
+                yield from self._iter_m3u(f)
+            else:
+                yield from self._iter_txt(f)
+
+    @staticmethod
+    def _iter_txt(f) -> Iterator[PlaylistEntry]:
+        group = user_agent = ''
+        intern = sys.intern
+        for line_no, line in enumerate(f, 1):
+            text = line.strip()
+            if not text or text[0] == '#':
+                continue
+            name, sep, url = text.partition(',')
+            if not sep:
+                if text.startswith(USER_AGENT_PREFIX):
+                    user_agent = intern(text[len(USER_AGENT_PREFIX):].strip())
+                continue
+            url = url.strip()
+            if url == '#genre#':
+                group = intern(name.strip())
+                user_agent = ''
+            elif '://' in url:
+                yield PlaylistEntry(name.strip(), url, group, user_agent, line_no)
+
+    @staticmethod
+    def _iter_m3u(f) -> Iterator[PlaylistEntry]:
+        intern = sys.intern
+        extinf = ''
+        extinf_line = 0
+        options = []
+        for line_no, line in enumerate(f, 1):
+            text = line.strip()
+            if not text:
+                continue
+            if text[0] == '#':
+                if text[:7].upper() == '#EXTINF':
+                    extinf, extinf_line, options = text, line_no, []
+                elif extinf and text[:7].upper() != '#EXTM3U':
+                    options.append(text)
+                continue
+            if not extinf:
+                continue
+            match = GROUP_TITLE_PATTERN.search(extinf)
+            user_agent = ''
+            for option in options:
+                if option.lower().startswith('#extvlcopt:http-user-agent='):
+                    user_agent = intern(option.split('=', 1)[1])
+            yield PlaylistEntry(
+                extinf.rpartition(',')[2].strip(), text,
+                intern(match.group(1)) if match else '', user_agent, extinf_line, extinf, tuple(options),
+            )
+            extinf = ''
+
+
+class PlaylistWriter:
+    """
+    把PlaylistEntry写成 "名称,URL"（txt）或 #EXTM3U（m3u）格式；先写临时文件，close时原子替换
+    txt格式在分组变化时写分组标题、UA变化时写 "ua=" 行；m3u格式尽量保留原#EXTINF行
+    """
+
+    def __init__(self, filepath: str, format: str = 'txt', header: str = ''):
+        self.filepath = filepath
+        self.format = format
+        self.count = 0
+        self._output = AtomicFile(filepath, newline='\n')
+        self._file = self._output.file
+        self._group = None
+        self._user_agent = ''
+        self._commented = False
+        if format == 'm3u':
+            self._file.write((header or '#EXTM3U') + '\n')
+
+    def comment(self, text: str):
+        """写一行注释"""
+        self._file.write(f"# {text}\n")
+        self._commented = True
+
+    def write(self, entry: PlaylistEntry):
+        write = self._file.write
+        if self.format == 'm3u':
+            if entry.extinf:
+                write(entry.extinf + '\n')
+            else:
+                group = f' group-title="{entry.group}"' if entry.group else ''
+                write(f'#EXTINF:-1 tvg-name="{entry.name}"{group},{entry.name}\n')
+            for option in entry.options:
+                write(option + '\n')
+            if entry.user_agent and not entry.options:
+                write(f'#EXTVLCOPT:http-user-agent={entry.user_agent}\n')
+        else:
+            if entry.group != self._group:
+                if self.count or self._commented:
+                    write('\n')
+                    self._commented = False
+                if entry.group:
+                    write(entry.group + GENRE_SUFFIX + '\n')
+                self._group = entry.group
+                self._user_agent = ''
+            if entry.user_agent != self._user_agent:
+                write(USER_AGENT_PREFIX + entry.user_agent + '\n')
+                self._user_agent = entry.user_agent
+        write(f"{entry.name},{entry.url}\n" if self.format != 'm3u' else entry.url + '\n')
+        self.count += 1
+
+    def close(self):
+        if self._file:
+            self._file = None
+            self._output.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type and self._file:
+            self._file = None
+            self._output.discard()
+        else:
+            self.close()
+
+
+CHANNEL_KEY_NOISE = re.compile(r'[\s\-_·|:：()（）\[\]【】*?]+|(?<=[A-Z0-9])(?:UHD|FHD|HD)$|高清|超清|标清|蓝光|4K|8K|1080P|720P')
+
+
+def channel_key(name: str) -> str:
+    """规范化频道名称用于索引查找：大写，去掉分隔符、括号和清晰度标记，如 CCTV-1 高清 → CCTV1"""
+    return CHANNEL_KEY_NOISE.sub('', name.upper())
+
+
+class PlaylistIndex:
+    """
+    直播源列表的磁盘索引（SQLite）：规范化频道名、分组、主机 → 条目在源文件中的字节偏移
+    按文件的修改时间和大小增量重建，只重新索引变化过的文件；查询时用mmap只读取命中条目所在的几行，
+    不需要逐行扫描整个文件；查询前会检查文件是否在索引后被修改，修改过的先重新索引
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.logger = logging.getLogger(__name__)
+        self._conn = sqlite3.connect(filepath)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER, format TEXT, header TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "file_id INTEGER, name_key TEXT, name TEXT, grp TEXT, host TEXT, netloc TEXT, user_agent TEXT, "
+            "start INTEGER, end INTEGER, line_no INTEGER)"
+        )
+        for column in ('name_key', 'grp', 'host', 'netloc', 'file_id'):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{column} ON entries({column})")
+        self._maps = {}
+
+    def refresh(self, paths: List[str]) -> Dict:
+        """
+        增量更新索引：新增或修改过的文件重新索引，已删除的文件从索引中移除
+        :param paths: 列表文件或目录（目录中的 .txt / .m3u / .m3u8 文件及无扩展名文件）
+        :return: {'indexed': 重新索引的文件数, 'unchanged': 未变化的文件数, 'removed': 移除的文件数, 'entries': 新索引的条目数}
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                try:
+                    names = sorted(os.listdir(path))
+                except OSError as e:
+                    self.logger.warning(f"⚠️ 无法读取目录 {path}: {e}")
+                    continue
+                for name in names:
+                    full = os.path.join(path, name)
+                    if os.path.isfile(full) and os.path.splitext(name)[1].lower() in ('.txt', '.m3u', '.m3u8', ''):
+                        files.append(os.path.abspath(full))
+            else:
+                files.append(os.path.abspath(path))
+        
+        stats = {'indexed': 0, 'unchanged': 0, 'removed': 0, 'entries': 0}
+        known = {path: (file_id, mtime_ns, size) for file_id, path, mtime_ns, size in
+                 self._conn.execute("SELECT id, path, mtime_ns, size FROM files")}
+        for path in files:
+            record = known.get(path)
+            try:
+                st = os.stat(path)
+                if record and record[1:] == (st.st_mtime_ns, st.st_size):
+                    stats['unchanged'] += 1
+                    continue
+                stats['entries'] += self._index_file(path, st, record[0] if record else None)
+                stats['indexed'] += 1
+            except OSError as e:
+                self.logger.warning(f"⚠️ 无法读取 {path}: {e}")
+                if record:
+                    self._remove(record[0], path)
+                    del known[path]
+                    stats['removed'] += 1
+        for path, (file_id, _, _) in known.items():
+            if not os.path.exists(path):
+                self._remove(file_id, path)
+                stats['removed'] += 1
+        return stats
+
+    def _remove(self, file_id: int, path: str):
+        """从索引中删除一个文件及其全部条目"""
+        with self._conn:
+            self._conn.execute("DELETE FROM entries WHERE file_id = ?", (file_id,))
+            self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        mapped = self._maps.pop(path, None)
+        if mapped is not None:
+            mapped.close()
+
+    def _ensure_current(self):
+        """查询前检查已索引的文件：修改过的重新索引，已删除或无法读取的从索引中移除"""
+        for file_id, path, mtime_ns, size in self._conn.execute(
+                "SELECT id, path, mtime_ns, size FROM files").fetchall():
+            try:
+                st = os.stat(path)
+                if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+                    self.logger.info(f"{os.path.basename(path)} 在索引后被修改，重新索引")
+                    self._index_file(path, st, file_id)
+            except OSError as e:
+                self.logger.warning(f"⚠️ 无法读取 {path}，已从索引中移除: {e}")
+                self._remove(file_id, path)
+
+    def _index_file(self, path: str, st, file_id: int = None) -> int:
+        """重新索引一个文件：用PlaylistReader的解析规则逐行读取，同时记录每行的字节偏移"""
+        reader = PlaylistReader(path)
+        offsets = []  # 每行的起始字节偏移
+        position = [0]
+        
+        def lines(f):
+            for raw in f:
+                offsets.append(position[0])
+                position[0] += len(raw)
+                yield raw.decode('utf-8', errors='replace').lstrip('\ufeff') if len(offsets) == 1 \
+                    else raw.decode('utf-8', errors='replace')
+        
+        parse = PlaylistReader._iter_m3u if reader.format == 'm3u' else PlaylistReader._iter_txt
+        rows = []
+        with open(path, 'rb') as f:
+            for entry in parse(lines(f)):
+                parts = urlsplit(entry.url)
+                try:
+                    host = (parts.hostname or '').lower()
+                    netloc = parts.netloc.rpartition('@')[2].lower()
+                except ValueError:
+                    host = netloc = ''
+                rows.append((channel_key(entry.name), entry.name, entry.group, host, netloc, entry.user_agent,
+                             offsets[entry.line_no - 1], position[0], entry.line_no))
+        
+        with self._conn:
+            if file_id is None:
+                file_id = self._conn.execute(
+                    "INSERT INTO files (path, mtime_ns, size, format, header) VALUES (?, ?, ?, ?, ?)",
+                    (path, st.st_mtime_ns, st.st_size, reader.format, reader.header)
+                ).lastrowid
+            else:
+                self._conn.execute("DELETE FROM entries WHERE file_id = ?", (file_id,))
+                self._conn.execute("UPDATE files SET mtime_ns = ?, size = ?, format = ?, header = ? WHERE id = ?",
+                                   (st.st_mtime_ns, st.st_size, reader.format, reader.header, file_id))
+            self._conn.executemany(f"INSERT INTO entries VALUES ({file_id}, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        mapped = self._maps.pop(path, None)
+        if mapped is not None:
+            mapped.close()
+        return len(rows)
+
+    def query(self, names: List[str] = (), group: str = None, host: str = None, prefix: bool = True):
+        """
+        按频道名（任一匹配）、分组和主机（同时指定时都要满足）查找条目，按文件和行号顺序产出(文件路径, PlaylistEntry)
+        :param prefix: 频道名按前缀匹配，但不会让 "CCTV1" 匹配到 "CCTV10"
+        :param host: 主机名，或 "主机:端口"（例如某个udpxy网关）
+        """
+        clauses = []
+        params = []
+        if names:
+            name_clauses = []
+            for name in names:
+                key = channel_key(name)
+                name_clauses.append("name_key = ?")
+                params.append(key)
+                if prefix:
+                    # 以数字结尾时下一个字符不能是数字
+                    name_clauses.append("name_key GLOB ?")
+                    params.append(key + ('[^0-9]*' if key[-1:].isdigit() else '?*'))
+            clauses.append(f"({' OR '.join(name_clauses)})")
+        if group:
+            clauses.append("grp = ?")
+            params.append(group)
+        if host:
+            host = host.lower()
+            if host.startswith('[') or host.count(':') == 1:
+                clauses.append("netloc = ?")
+                params.append(host)
+            else:
+                clauses.append("host = ?")
+                params.append(host)
+        sql = ("SELECT files.path, files.format, entries.name, entries.grp, entries.user_agent, entries.start, "
+               "entries.end, entries.line_no FROM entries JOIN files ON files.id = entries.file_id")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY entries.file_id, entries.start"
+        self._ensure_current()
+        for path, fmt, name, group_name, user_agent, start, end, line_no in self._conn.execute(sql, params).fetchall():
+            try:
+                entry = self._read_entry(path, fmt, start, end)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"⚠️ 无法读取 {path}: {e}")
+                continue
+            if entry is None or entry.name != name:
+                # 文件在检查之后又被修改，偏移已经对不上
+                self.logger.warning(f"⚠️ {os.path.basename(path)}:{line_no} 与索引不一致，已跳过（请重新运行 --index）")
+                continue
+            # txt格式的分组和UA来自前面的标题行，不在条目所在行中
+            entry.group = entry.group or group_name
+            entry.user_agent = entry.user_agent or user_agent
+            entry.line_no = line_no
+            yield path, entry
+
+    def _read_entry(self, path: str, fmt: str, start: int, end: int):
+        """从mmap中读取条目所在的几行并解析"""
+        mapped = self._maps.get(path)
+        if mapped is None:
+            with open(path, 'rb') as f:
+                mapped = self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        lines = mapped[start:end].decode('utf-8', errors='replace').lstrip('\ufeff').splitlines(keepends=True)
+        parse = PlaylistReader._iter_m3u if fmt == 'm3u' else PlaylistReader._iter_txt
+        return next(parse(lines), None)
+
+    def export(self, matches, output_file: str, keep_params: frozenset = None) -> int:
+        """把查询结果按规范化URL去重后写成一个列表（.m3u/.m3u8为M3U格式，否则为txt），返回写入条数"""
+        fmt = 'm3u' if os.path.splitext(output_file)[1].lower() in ('.m3u', '.m3u8') else 'txt'
+        seen = set()
+        with PlaylistWriter(output_file, fmt) as playlist:
+            for _, entry in matches:
+                key = normalize_url(entry.url, keep_params)
+                if key not in seen:
+                    seen.add(key)
+                    playlist.write(entry)
+        return playlist.count
+
+    def groups(self) -> List[tuple]:
+        """全部分组及条目数"""
+        return self._conn.execute("SELECT grp, COUNT(*) FROM entries GROUP BY grp ORDER BY COUNT(*) DESC").fetchall()
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+        self._conn.close()
+
+
+EXPORT_FORMATS = ('txt', 'm3u', 'detail', 'json', 'csv')
+
+
+class ResultExporter:
+    """
+    一遍写出扫描结果的全部格式：txt主列表（"名称,URL"，#genre#分组）、m3u（#EXTINF带group-title）、
+    detail详细列表（含响应时间、实测速度和备用地址）、json和csv
+    调用方按最终顺序逐个频道write，不需要为每种格式各排序一次；每个文件先写临时文件，正常结束时再替换，
+    出错时删除临时文件、保留旧文件；预览只保留主列表的最后几行
+    """
+
+    def __init__(self, output_dir: str, filename: str, formats=('txt', 'detail'), comments: List[str] = (),
+                 preview: int = 5):
+        stem = os.path.splitext(filename)[0]
+        names = {'txt': filename, 'm3u': f"{stem}.m3u", 'detail': f"详细_{filename}",
+                 'json': f"{stem}.json", 'csv': f"{stem}.csv"}
+        self.paths = {fmt: os.path.join(output_dir, names[fmt]) for fmt in EXPORT_FORMATS if fmt in formats}
+        self.comments = list(comments)
+        self.tail = deque(maxlen=preview)
+        self.count = 0  # 频道数
+        self.addresses = 0  # 地址数（含备用地址）
+        self._playlists = {}
+        self._files = {}
+        self._outputs = []
+        self._csv = None
+
+    def __enter__(self):
+        try:
+            for fmt, path in self.paths.items():
+                if fmt in ('txt', 'm3u'):
+                    self._playlists[fmt] = PlaylistWriter(path, fmt)
+                else:
+                    encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+                    output = AtomicFile(path, encoding, newline='')
+                    self._outputs.append(output)
+                    self._files[fmt] = output.file
+        except OSError:
+            self._abort()
+            raise
+        if 'txt' in self._playlists:
+            playlist = self._playlists['txt']
+            playlist.comment("有效直播源列表")
+            for comment in self.comments:
+                playlist.comment(comment)
+        if 'detail' in self._files:
+            self._files['detail'].write("# 有效直播源详细列表\n" + ''.join(f"# {c}\n" for c in self.comments) + "\n")
+        if 'json' in self._files:
+            self._files['json'].write('[')
+        if 'csv' in self._files:
+            self._csv = csv.writer(self._files['csv'])
+            self._csv.writerow(['name', 'group', 'role'] + ResultSink.fields)
+        return self
+
+    def write(self, group: List[Dict], title: str = ''):
+        """写出一个频道：group[0]为主地址，其余为备用地址；title为所属分组"""
+        self.count += 1
+        self.addresses += len(group)
+        name = f"频道{self.count}"
+        channel = group[0]
+        entry = PlaylistEntry(name, channel['url'], title)
+        for playlist in self._playlists.values():
+            playlist.write(entry)
+        self.tail.append(f"{name},{channel['url']}")
+        
+        f = self._files.get('detail')
+        if f:
+            f.write(f"# {name} - {channel['channel_name']}\n")
+            f.write(f"# 响应时间: {channel['response_time']}s | IP版本: {channel['ip_version']} | ID: {channel['id']}\n")
+            if channel.get('throughput'):
+                bandwidth = channel.get('bandwidth') or 0
+                advertised = f"{bandwidth / 1e6:.2f}Mbps" if bandwidth else "未知"
+                f.write(f"# 实测速度: {channel['throughput'] / 1e6:.2f}Mbps | 标称码率: {advertised}\n")
+            if len(group) > 1:
+                f.write(f"# 备用地址: {len(group) - 1} 个 (ID: {', '.join(str(backup['id']) for backup in group[1:])})\n")
+            for backup in group:
+                f.write(f"{name},{backup['url']}\n")
+            f.write("\n")
+        
+        f = self._files.get('json')
+        if f:
+            item = {'name': name, 'group': title}
+            item.update((key, channel.get(key, '')) for key in ResultSink.fields)
+            item['fallbacks'] = [backup['url'] for backup in group[1:]]
+            f.write((',\n' if self.count > 1 else '\n') + json.dumps(item, ensure_ascii=False))
+        
+        if self._csv:
+            for role, record in enumerate(group):
+                self._csv.writerow([name, title, 'backup' if role else 'primary']
+                                   + [record.get(key, '') for key in ResultSink.fields])
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self._abort()
+            return
+        for playlist in self._playlists.values():
+            playlist.close()
+        if 'json' in self._files:
+            self._files['json'].write('\n]\n')
+        for output in self._outputs:
+            output.commit()
+
+    def _abort(self):
+        for playlist in self._playlists.values():
+            playlist.__exit__(RuntimeError, None, None)
+        for output in self._outputs:
+            output.discard()
+
+
+class ScanCheckpoint:
+    """扫描断点：按基础URL模式记录已完成的ID区间（合并为连续区间存储）和结果文件"""
+
+    def __init__(self, filepath: str, base_url: str):
+        self.filepath = filepath
+        self.base_url = base_url
+        self.sink_file = ''
+        self.sink_format = ''
+        # 已完成区间，starts/ends一一对应，按起点有序且互不相邻
+        self.starts = []
+        self.ends = []
+        self.save_interval = 2.0
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(output_dir: str, base_url: str) -> str:
+        """断点文件路径，由基础URL模式决定"""
+        key = hashlib.md5(base_url.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(output_dir, f".扫描断点_{key}.json")
+
+    def load(self) -> bool:
+        """读取断点文件，不存在或损坏时返回False"""
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('base_url') != self.base_url:
+            return False
+        self.sink_file = data.get('sink_file', '')
+        self.sink_format = data.get('sink_format', '')
+        self.starts = []
+        self.ends = []
+        for start, end in data.get('completed', []):
+            self.starts.append(start)
+            self.ends.append(end)
+        return True
+
+    def save(self, force: bool = False):
+        """写入断点文件（先写临时文件再替换），非强制时按间隔节流"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_save < self.save_interval:
+                return
+            self._last_save = now
+            data = {
+                'base_url': self.base_url,
+                'sink_file': self.sink_file,
+                'sink_format': self.sink_format,
+                'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'completed': [[s, e] for s, e in zip(self.starts, self.ends)],
+            }
+        atomic_write(self.filepath, json.dumps(data, ensure_ascii=False))
+
+    def remove(self):
+        """删除断点文件"""
+        self.starts = []
+        self.ends = []
+        self.sink_file = ''
+        try:
+            os.remove(self.filepath)
+        except OSError:
+            pass
+
+    def mark_done(self, id_num: int):
+        """记录一个已完成的ID，并与相邻区间合并"""
+        with self._lock:
+            starts, ends = self.starts, self.ends
+            i = bisect.bisect_right(starts, id_num) - 1
+            if i >= 0 and ends[i] >= id_num:
+                return
+            join_left = i >= 0 and ends[i] == id_num - 1
+            join_right = i + 1 < len(starts) and starts[i + 1] == id_num + 1
+            if join_left and join_right:
+                ends[i] = ends[i + 1]
+                del starts[i + 1]
+                del ends[i + 1]
+            elif join_left:
+                ends[i] = id_num
+            elif join_right:
+                starts[i + 1] = id_num
+            else:
+                starts.insert(i + 1, id_num)
+                ends.insert(i + 1, id_num)
+
+    def mark_range_done(self, start_id: int, end_id: int):
+        """记录一段已完成的ID区间，并与重叠或相邻的区间合并"""
+        with self._lock:
+            starts, ends = self.starts, self.ends
+            lo = bisect.bisect_left(ends, start_id - 1)
+            hi = bisect.bisect_right(starts, end_id + 1)
+            if lo < hi:
+                start_id = min(start_id, starts[lo])
+                end_id = max(end_id, ends[hi - 1])
+            starts[lo:hi] = [start_id]
+            ends[lo:hi] = [end_id]
+
+    def is_done(self, id_num: int) -> bool:
+        i = bisect.bisect_right(self.starts, id_num) - 1
+        return i >= 0 and self.ends[i] >= id_num
+
+    def completed_count(self, start_id: int, end_id: int) -> int:
+        """[start_id, end_id]范围内已完成的ID数量"""
+        return sum(max(0, min(e, end_id) - max(s, start_id) + 1)
+                   for s, e in zip(self.starts, self.ends))
+
+    def pending_ranges(self, start_id: int, end_id: int) -> Iterator[range]:
+        """[start_id, end_id]范围内尚未完成的ID区间"""
+        current = start_id
+        for s, e in zip(list(self.starts), list(self.ends)):
+            if e < current:
+                continue
+            if s > end_id:
+                break
+            if s > current:
+                yield range(current, s)
+            current = e + 1
+        if current <= end_id:
+            yield range(current, end_id + 1)
+
+
+class MonitorState:
+    """
+    健康监控的持久状态：列表中每个地址（按规范化URL）的在线状态、复查间隔和下次检测时间
+    结果与上次相同时复查间隔加倍，状态变化时重置为min_interval；时好时坏的地址（flaps）间隔上限更低，
+    所以稳定的地址越查越少，不稳定或刚失效的地址保持高频复查，总请求量取决于变化的多少而不是列表长度
+    """
+
+    def __init__(self, filepath: str, min_interval: float = 300, max_interval: float = 86400):
+        self.filepath = filepath
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.entries = {}  # 规范化URL -> 状态
+
+    def load(self) -> bool:
+        """读取状态文件，不存在或损坏时返回False"""
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('entries', {})
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def save(self):
+        """写入状态文件（先写临时文件再替换）"""
+        atomic_write(self.filepath, json.dumps({'updated': time.strftime('%Y-%m-%d %H:%M:%S'), 'entries': self.entries},
+                                               ensure_ascii=False))
+
+    def sync(self, urls: Dict[str, str]) -> List[Dict]:
+        """
+        按列表文件的当前内容增删地址：新地址立即检测，已从列表删除的地址不再监控
+        :param urls: 规范化URL -> 原URL
+        :return: 被删除的、原本在线的地址状态
+        """
+        removed = [self.entries.pop(key) for key in list(self.entries) if key not in urls]
+        for key, url in urls.items():
+            if key not in self.entries:
+                self.entries[key] = {'url': url, 'alive': None, 'next_check': 0, 'interval': self.min_interval,
+                                     'flaps': 0, 'streak': 0}
+        return [entry for entry in removed if entry['alive']]
+
+    def due(self, now: float) -> List[str]:
+        """到期需要检测的地址，最早到期的在前"""
+        keys = [key for key, entry in self.entries.items() if entry['next_check'] <= now]
+        keys.sort(key=lambda key: self.entries[key]['next_check'])
+        return keys
+
+    def next_due(self) -> float:
+        return min((entry['next_check'] for entry in self.entries.values()), default=time.time() + self.max_interval)
+
+    def update(self, key: str, result: "ProbeResult", now: float):
+        """
+        记录一次检测结果并安排下次检测
+        :return: 变化类型 added（上线）/ removed（下线）/ changed（在线但内容或IP版本变化），没有变化返回None
+        """
+        entry = self.entries[key]
+        was_alive = entry['alive']
+        change = None
+        if was_alive is None:
+            change = 'added' if result.valid else None
+            entry['interval'] = self.min_interval
+        elif was_alive != result.valid:
+            change = 'added' if result.valid else 'removed'
+            entry['flaps'] += 1
+            entry['streak'] = 0
+            entry['interval'] = self.min_interval
+        else:
+            if result.valid and ((entry.get('fingerprint') and result.fingerprint
+                                  and entry['fingerprint'] != result.fingerprint)
+                                 or entry.get('ip_version') != result.ip_version):
+                change = 'changed'
+            entry['streak'] += 1
+            if entry['streak'] >= 8 and entry['flaps']:
+                # 连续稳定一段时间后逐渐恢复为普通地址
+                entry['flaps'] -= 1
+                entry['streak'] = 0
+            ceiling = max(self.min_interval, self.max_interval / 2 ** min(entry['flaps'], 5))
+            entry['interval'] = min(ceiling, entry['interval'] * 2)
+        entry.update({
+            'alive': result.valid,
+            'checked_at': now,
+            # 加一点随机抖动，避免同一批加入的地址总是同时到期
+            'next_check': now + entry['interval'] * random.uniform(0.9, 1.1),
+            'status': result.status,
+            'error': result.error,
+            'response_time': result.response_time,
+            'ip_version': result.ip_version,
+            'fingerprint': result.fingerprint,
+        })
+        return change
+
+
+class ProbeCache:
+    """探测结果磁盘缓存（SQLite）：URL → 状态、错误、时间戳、响应时间
+    
+    有效和无效结果分别设置有效期；只缓存收到了HTTP响应的结果，超时、连接失败等临时错误不缓存
+    """
+
+    columns = ['valid', 'status', 'error', 'checked_at', 'response_time',
+               'channel_name', 'content_type', 'content_length', 'fingerprint', 'seq_offset']
+
+    def __init__(self, filepath: str, positive_ttl: float = 6 * 3600,
+                 negative_ttl: float = 3600, max_entries: int = 500000):
+        self.filepath = filepath
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.commit_every = 200
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS probe_cache ("
+            "url TEXT PRIMARY KEY, valid INTEGER, status INTEGER, error TEXT, "
+            "checked_at REAL, response_time REAL, channel_name TEXT, "
+            "content_type TEXT, content_length INTEGER, fingerprint TEXT, seq_offset REAL)"
+        )
+        # 旧版本缓存没有内容指纹列
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(probe_cache)")}
+        for column, kind in (('fingerprint', 'TEXT'), ('seq_offset', 'REAL')):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE probe_cache ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_checked_at ON probe_cache(checked_at)")
+        self.evict()
+
+    def get(self, url: str):
+        """返回未过期的缓存结果，没有则返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.columns)} FROM probe_cache WHERE url = ?", (url,)
+            ).fetchone()
+        if row:
+            cached = dict(zip(self.columns, row))
+            ttl = self.positive_ttl if cached['valid'] else self.negative_ttl
+            if time.time() - cached['checked_at'] < ttl:
+                cached['valid'] = bool(cached['valid'])
+                # error列保存ProbeError代码，旧版本缓存中的文字说明按未知错误处理
+                error = str(cached.pop('error') or 0)
+                cached['code'] = ProbeError(int(error)) if error.isdigit() else ProbeError.OTHER
+                cached['fingerprint'] = cached['fingerprint'] or ''
+                if cached['seq_offset'] is None:
+                    cached['seq_offset'] = ''
+                with self._lock:
+                    self.hits += 1
+                return cached
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, result: "ProbeResult"):
+        """写入一条探测结果"""
+        if not result.status:
+            return
+        values = (result.url, int(result.valid), result.status, int(result.code),
+                  time.time(), result.response_time, result.channel_name,
+                  result.content_type, result.content_length, result.fingerprint,
+                  None if result.seq_offset == '' else result.seq_offset)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO probe_cache (url, {', '.join(self.columns)}) "
+                f"VALUES ({', '.join('?' * (len(self.columns) + 1))})", values
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._conn.commit()
+                self._pending = 0
+
+    def evict(self):
+        """删除过期记录，并把缓存条数限制在max_entries以内（先删最旧的）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM probe_cache WHERE (valid = 1 AND checked_at < ?) "
+                "OR (valid = 0 AND checked_at < ?)",
+                (now - self.positive_ttl, now - self.negative_ttl)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM probe_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM probe_cache WHERE url IN ("
+                    "SELECT url FROM probe_cache ORDER BY checked_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+
+class AsyncResponse:
+    """AsyncHTTPClient返回的响应，响应体按需读取"""
+
+    def __init__(self, client: "AsyncHTTPClient", key, reader, writer, status: int, headers: Dict,
+                 body: bool = True):
+        self.client = client
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status = status
+        self.headers = headers
+        self.url = ''
+        self._semaphore = None
+        self._chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        length = headers.get('content-length', '')
+        self._remaining = int(length) if length.isdigit() and not self._chunked else None
+        self._chunk_left = 0
+        self._eof = not body or status in (204, 304) or self._remaining == 0
+        # 只有能确定响应体边界的连接才能复用（HEAD响应没有响应体）
+        self.keep_alive = (headers.get('connection', '').lower() != 'close'
+                           and (not body or self._chunked or self._remaining is not None))
+
+    async def read(self, n: int) -> bytes:
+        """读取最多n字节响应体，读完返回b''"""
+        if self._eof:
+            return b''
+        reader = self.reader
+        if self._chunked:
+            if self._chunk_left == 0:
+                size_line = await reader.readline()
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # 跳过trailer
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._eof = True
+                    return b''
+                self._chunk_left = size
+            data = await reader.read(min(n, self._chunk_left))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', self._chunk_left)
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await reader.readexactly(2)
+            return data
+        if self._remaining is not None:
+            data = await reader.read(min(n, self._remaining))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', self._remaining)
+            self._remaining -= len(data)
+            self._eof = self._remaining == 0
+            return data
+        data = await reader.read(n)
+        self._eof = not data
+        return data
+
+    async def release(self, drain_limit: int = 64 * 1024):
+        """剩余响应体较小时读完并把连接放回连接池，否则关闭连接"""
+        try:
+            if (self.keep_alive and not self._eof and self._remaining is not None
+                    and self._remaining <= drain_limit):
+                while await self.read(65536):
+                    pass
+        except (OSError, asyncio.IncompleteReadError):
+            self.keep_alive = False
+        if self.keep_alive and self._eof:
+            self.client.put_idle(self.key, self.reader, self.writer)
+            self._release_slot()
+        else:
+            self.close()
+
+    def close(self):
+        """关闭连接（不复用）"""
+        self.writer.close()
+        self._release_slot()
+
+    def _release_slot(self):
+        if self._semaphore:
+            self._semaphore.release()
+            self._semaphore = None
+
+
+class AsyncHTTPClient:
+    """
+    基于asyncio的轻量HTTP/1.1客户端（只依赖标准库）
+    按主机复用keep-alive连接，限制单主机并发连接数和全局每秒请求数
+    """
+
+    def __init__(self, timeout: float = 5, per_host_limit: int = 32,
+                 requests_per_second: float = 0, resolver: HostResolver = None, headers: Dict = None,
+                 max_redirects: int = 5, metrics: "ScanMetrics" = None):
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.requests_per_second = requests_per_second
+        self.resolver = resolver or HostResolver()
+        self.headers = headers or {}
+        self.max_redirects = max_redirects
+        self.metrics = metrics
+        self.new_connections = 0
+        self.reused_connections = 0
+        self._idle = {}  # (scheme, host, port) -> [(reader, writer)]
+        self._limits = {}  # (scheme, host, port) -> Semaphore
+        self._next_slot = 0.0
+        self._ssl_context = None
+
+    async def get(self, url: str, headers: Dict = None) -> AsyncResponse:
+        """发起GET请求并跟随重定向，返回尚未读取响应体的响应；headers覆盖默认请求头"""
+        return await self.request('GET', url, headers)
+
+    async def request(self, method: str, url: str, headers: Dict = None) -> AsyncResponse:
+        """发起GET或HEAD请求并跟随重定向"""
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            scheme = parts.scheme.lower()
+            if scheme not in ('http', 'https') or not parts.hostname:
+                raise ValueError(f"不支持的URL: {url}")
+            port = parts.port or (443 if scheme == 'https' else 80)
+            key = (scheme, parts.hostname, port)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            
+            semaphore = self._limits.get(key)
+            if semaphore is None:
+                semaphore = self._limits[key] = asyncio.Semaphore(self.per_host_limit)
+            await semaphore.acquire()
+            try:
+                await self._throttle()
+                response = await self._request(key, parts.netloc.rpartition('@')[2], path, headers, method)
+            except BaseException:
+                semaphore.release()
+                raise
+            response._semaphore = semaphore
+            
+            location = response.headers.get('location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                await response.release()
+                url = urljoin(url, location)
+                continue
+            response.url = url
+            return response
+        raise ValueError(f"重定向次数过多: {url}")
+
+    def put_idle(self, key, reader, writer):
+        self._idle.setdefault(key, []).append((reader, writer))
+
+    def close(self):
+        """关闭所有空闲连接"""
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _throttle(self):
+        """按每秒请求数为每个请求分配发送时间"""
+        if self.requests_per_second <= 0:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + 1.0 / self.requests_per_second
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _connect(self, key):
+        """取一个空闲连接，没有则新建；返回(reader, writer, 是否复用)"""
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused_connections += 1
+                return reader, writer, True
+            writer.close()
+        
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        connect_start = time.time()
+        reader, writer = await self.resolver.open_connection(host, port, ssl_context)
+        if self.metrics:
+            self.metrics.observe('connect', time.time() - connect_start)
+        self.new_connections += 1
+        return reader, writer, False
+
+    async def _request(self, key, netloc: str, path: str, headers: Dict = None,
+                       method: str = 'GET') -> AsyncResponse:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {netloc}"]
+        merged = {**self.headers, **headers} if headers else self.headers
+        lines += [f"{name}: {value}" for name, value in merged.items()]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1', errors='replace')
+        
+        for attempt in range(2):
+            reader, writer, reused = await self._connect(key)
+            request_start = time.time()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("连接已被服务器关闭")
+                if self.metrics:
+                    self.metrics.observe('ttfb', time.time() - request_start)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # 复用的空闲连接可能已被服务器关闭，换新连接重试一次
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                # 包括超时取消（CancelledError），否则连接会一直打开到事件循环结束
+                writer.close()
+                raise
+        
+        try:
+            try:
+                status = int(status_line.split(None, 2)[1])
+            except (IndexError, ValueError):
+                raise ValueError(f"无效的HTTP响应: {status_line[:50]!r}")
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            writer.close()
+            raise
+        return AsyncResponse(self, key, reader, writer, status, headers, body=method != 'HEAD')
+
+
+class ProbeError(enum.IntEnum):
+    """探测失败原因的代码；文字说明只在需要显示时由ProbeResult.error生成"""
+    NONE = 0
+    NOT_M3U8 = 1
+    HTTP = 2  # 非200响应，状态码见ProbeResult.status
+    TIMEOUT = 3
+    REFUSED = 4
+    DNS = 5
+    CONNECTION = 6
+    BAD_URL = 7
+    UNSUPPORTED = 8
+    OTHER = 9
+
+    @classmethod
+    def of(cls, error: BaseException) -> "ProbeError":
+        """把请求异常归类为错误代码"""
+        if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError, socket.timeout)):
+            return cls.TIMEOUT
+        text = str(error).lower()
+        if isinstance(error, ConnectionRefusedError) or 'refused' in text:
+            return cls.REFUSED
+        if isinstance(error, socket.gaierror) or any(
+                marker in text for marker in ('resolve', 'name or service', 'getaddrinfo', 'nodename')):
+            return cls.DNS
+        if 'timed out' in text:
+            return cls.TIMEOUT
+        if isinstance(error, (requests.exceptions.ConnectionError, OSError, asyncio.IncompleteReadError)):
+            return cls.CONNECTION
+        return cls.OTHER
+
+
+ERROR_MESSAGES = {
+    ProbeError.NONE: '',
+    ProbeError.NOT_M3U8: '不是有效的M3U8文件',
+    ProbeError.TIMEOUT: '请求超时',
+    ProbeError.REFUSED: '连接被拒绝',
+    ProbeError.DNS: '域名解析失败',
+    ProbeError.CONNECTION: '连接失败',
+    ProbeError.BAD_URL: 'IPv6地址格式错误，缺少方括号',
+    ProbeError.UNSUPPORTED: '不支持的协议',
+    ProbeError.OTHER: '未知错误',
+}
+
+ERROR_CLASSES = {ProbeError.TIMEOUT: 'timeout', ProbeError.REFUSED: 'refused', ProbeError.DNS: 'dns',
+                 ProbeError.CONNECTION: 'connection'}
+
+
+class ProbeResult:
+    """
+    单个ID的探测结果。百万级ID的扫描中绝大多数结果无效、统计后即丢弃，
+    用__slots__代替每个ID一个多键字典，失败原因只保存ProbeError代码
+    仍支持result['键']、get()和update()，结果文件、缓存和检测报告按字段名读取
+    """
+    __slots__ = ('id', 'url', 'valid', 'channel_name', 'response_time', 'content_type', 'content_length',
+                 'status', 'code', 'cached', 'ip_version', 'accept_stream', 'job', 'fingerprint', 'seq_offset')
+
+    def __init__(self, id_num: int = 0, url: str = '', ip_version: str = ''):
+        self.id = id_num
+        self.url = url
+        self.valid = False
+        self.channel_name = ''
+        self.response_time = 0
+        self.content_type = ''
+        self.content_length = 0
+        self.status = 0
+        self.code = ProbeError.NONE
+        self.cached = False
+        self.ip_version = ip_version
+        self.accept_stream = False  # 非播放列表地址只要返回数据就算有效（批量检测）
+        self.job = 0  # 批量任务模式中所属任务的序号
+        self.fingerprint = ''  # 播放列表内容指纹，见playlist_fingerprint
+        self.seq_offset = ''
+
+    @property
+    def error(self) -> str:
+        if self.code == ProbeError.HTTP:
+            return f'HTTP {self.status}'
+        return ERROR_MESSAGES[self.code]
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        setattr(self, key, value)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def update(self, values: Dict):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return f"ProbeResult(id={self.id}, valid={self.valid}, status={self.status}, error={self.error!r})"
+
+
+def error_class(result: ProbeResult) -> str:
+    """把探测结果归为一个错误类别，用于统计：ok / cached / http_404 / not_m3u8 / timeout / refused / dns / connection / other"""
+    if result.cached:
+        return 'cached'
+    if result.valid:
+        return 'ok'
+    status = result.status
+    if status == 200:
+        return 'not_m3u8'
+    if status:
+        return f'http_{status}'
+    return ERROR_CLASSES.get(result.code, 'other')
+
+
+class Histogram:
+    """固定分桶的耗时直方图（秒）"""
+    __slots__ = ('counts', 'sum', 'count')
+    bounds = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按分桶估算分位数（返回所在桶的上界）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+
+class ScanMetrics:
+    """
+    扫描过程的结构化指标：各阶段耗时直方图、错误类别计数和实时吞吐量
+    阶段: dns / connect / ttfb（发出请求到收到响应头）/ body（读取响应体）/ parse（提取频道名称）
+    线程池引擎无法拆分连接建立过程，其ttfb包含建立连接的时间
+    """
+
+    phases = ('dns', 'connect', 'ttfb', 'body', 'parse')
+
+    def __init__(self, export_file: str = None, export_interval: float = 5.0):
+        self.histograms = {phase: Histogram() for phase in self.phases}
+        self.errors = {}
+        self.probes = 0
+        self.found = 0
+        self.started = time.time()
+        self.export_file = export_file
+        self.export_interval = export_interval
+        self._recent = deque()  # [(秒, 探测数)]，用于计算最近的吞吐量
+        self._last_export = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, phase: str, seconds: float):
+        with self._lock:
+            self.histograms[phase].observe(seconds)
+
+    def record(self, result: ProbeResult):
+        """记录一个探测结果"""
+        kind = error_class(result)
+        second = int(time.time())
+        with self._lock:
+            self.probes += 1
+            if result.valid:
+                self.found += 1
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            if self._recent and self._recent[-1][0] == second:
+                self._recent[-1][1] += 1
+            else:
+                self._recent.append([second, 1])
+                while self._recent and self._recent[0][0] < second - 10:
+                    self._recent.popleft()
+
+    def throughput(self, window: int = 10) -> float:
+        """最近window秒内每秒探测数"""
+        now = time.time()
+        with self._lock:
+            count = sum(n for second, n in self._recent if second >= now - window)
+        elapsed = min(window, max(now - self.started, 1e-3))
+        return count / elapsed
+
+    def snapshot(self) -> Dict:
+        elapsed = time.time() - self.started
+        with self._lock:
+            phases = {
+                phase: {
+                    'count': h.count,
+                    'sum': round(h.sum, 4),
+                    'p50': h.quantile(0.5),
+                    'p90': h.quantile(0.9),
+                    'p99': h.quantile(0.99),
+                    'buckets': dict(zip([str(b) for b in Histogram.bounds] + ['+Inf'], h.counts)),
+                }
+                for phase, h in self.histograms.items() if h.count
+            }
+            data = {
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'elapsed_seconds': round(elapsed, 2),
+                'probes': self.probes,
+                'found': self.found,
+                'errors': dict(self.errors),
+                'phases': phases,
+            }
+        data['probes_per_sec'] = round(self.throughput(), 2)
+        data['average_probes_per_sec'] = round(self.probes / elapsed, 2) if elapsed else 0
+        return data
+
+    def to_prometheus(self) -> str:
+        """Prometheus文本格式"""
+        lines = [
+            '# TYPE iptv_scan_probes_total counter',
+            f'iptv_scan_probes_total {self.probes}',
+            '# TYPE iptv_scan_found_total counter',
+            f'iptv_scan_found_total {self.found}',
+            '# TYPE iptv_scan_probes_per_second gauge',
+            f'iptv_scan_probes_per_second {self.throughput():.3f}',
+            '# TYPE iptv_scan_results_total counter',
+        ]
+        with self._lock:
+            for kind, count in sorted(self.errors.items()):
+                lines.append(f'iptv_scan_results_total{{class="{kind}"}} {count}')
+            lines.append('# TYPE iptv_scan_phase_seconds histogram')
+            for phase, h in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(list(Histogram.bounds) + ['+Inf'], h.counts):
+                    cumulative += count
+                    lines.append(f'iptv_scan_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+                lines.append(f'iptv_scan_phase_seconds_sum{{phase="{phase}"}} {h.sum:.6f}')
+                lines.append(f'iptv_scan_phase_seconds_count{{phase="{phase}"}} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, force: bool = False):
+        """写入指标文件（.prom为Prometheus文本格式，其它为JSON），非强制时按间隔节流"""
+        if not self.export_file:
+            return
+        now = time.time()
+        if not force and now - self._last_export < self.export_interval:
+            return
+        self._last_export = now
+        if self.export_file.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        atomic_write(self.export_file, content)
+
+
+class ScanProfiler:
+    """
+    cProfile钩子：主线程和每个工作线程各用一个Profile，结束时合并写入文件
+    Python 3.12起同一时间只能启用一个profiler，此时只分析主线程
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args):
+        """在当前线程的Profile下调用fn"""
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self.profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+
+    def dump(self, filepath: str):
+        """合并所有线程的统计并写入文件，返回pstats.Stats"""
+        stats = None
+        for profile in self.profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # 没有采集到数据的Profile
+                continue
+        if stats:
+            stats.dump_stats(filepath)
+        return stats
+
+
+class HostScheduler:
+    """
+    批量检测用的按主机调度：目标按主机分组，在有剩余任务的主机之间轮询取任务，
+    每个主机同时进行的请求不超过单主机上限（启用自适应限速时取控制器当前的并发额度），
+    这样一个慢主机或被限速的主机不会占满全部并发，总吞吐量随主机数量增长
+    只在调度线程（线程池引擎的主线程或asyncio事件循环）中使用，不加锁
+    """
+
+    def __init__(self, targets, host_of, per_host_limit: int, controller: "AdaptiveRateController" = None):
+        self.host_of = host_of
+        self.per_host_limit = per_host_limit
+        self.controller = controller
+        self.queues = {}  # 主机 -> 待检测目标的迭代器
+        self.remaining = {}  # 主机 -> 剩余目标数
+        self.host_limits = {}  # 主机 -> 单独设置的并发上限
+        self.ready = deque()  # 还有待检测目标的主机，轮询顺序
+        self.inflight = {}
+        self._pending = 0
+        self.running = 0
+        grouped = {}
+        for target in targets:
+            grouped.setdefault(host_of(target), []).append(target)
+        for host, waiting in grouped.items():
+            self.add(host, iter(waiting), len(waiting))
+
+    def add(self, host: str, targets: Iterator, count: int, limit: int = None):
+        """
+        追加某个主机的count个目标，targets可以是惰性迭代器（例如ID范围），不需要预先展开
+        :param limit: 该主机的并发上限，多次设置时取较小值
+        """
+        if limit:
+            self.host_limits[host] = min(limit, self.host_limits.get(host, limit))
+        if count <= 0:
+            return
+        if self.remaining.get(host):
+            self.queues[host] = itertools.chain(self.queues[host], targets)
+        else:
+            self.queues[host] = targets
+            self.ready.append(host)
+        self.remaining[host] = self.remaining.get(host, 0) + count
+        self.inflight.setdefault(host, 0)
+        self._pending += count
+
+    @property
+    def pending(self) -> int:
+        """尚未派发的目标数"""
+        return self._pending
+
+    def host_limit(self, host: str) -> int:
+        limit = self.host_limits.get(host, self.per_host_limit)
+        if self.controller:
+            return max(1, min(limit, self.controller.limit(host)))
+        return limit
+
+    def next(self):
+        """按主机轮询取下一个可以开始的目标；所有有任务的主机都已达到上限时返回None"""
+        for _ in range(len(self.ready)):
+            host = self.ready[0]
+            self.ready.rotate(-1)
+            if self.inflight[host] >= self.host_limit(host):
+                continue
+            target = next(self.queues[host])
+            self.remaining[host] -= 1
+            if not self.remaining[host]:
+                # 该主机刚被轮转到队尾
+                self.ready.pop()
+                del self.queues[host]
+            self.inflight[host] += 1
+            self._pending -= 1
+            self.running += 1
+            return target
+        return None
+
+    def done(self, target):
+        """目标检测完成，释放所在主机的额度"""
+        self.inflight[self.host_of(target)] -= 1
+        self.running -= 1
+
+    def __len__(self):
+        return self.pending
+
+
+class SparseExplorer(HostScheduler):
+    """
+    稀疏探索：按步长stride采样，在命中的ID两侧扩展出整个簇，采样仍有命中时步长减半再采样一轮
+    作为单主机的HostScheduler由两个引擎执行，比最终步长窄的簇可能漏掉
+    """
+
+    min_radius = 2
+
+    def __init__(self, start_id: int, end_id: int, host: str, per_host_limit: int,
+                 controller: "AdaptiveRateController" = None, stride: int = 16, min_stride: int = None,
+                 is_done=None, seeds=()):
+        super().__init__((), lambda id_num: host, per_host_limit, controller)
+        self.host = host
+        self.inflight[host] = 0
+        self.start_id = start_id
+        self.end_id = end_id
+        self.stride = max(1, stride)
+        self.min_stride = max(1, min_stride or self.stride // 4)
+        self.is_done = is_done or (lambda id_num: False)  # 断点中已完成的ID
+        self.probed = set()  # 本次已派发的ID
+        self.hits = []  # 已发现的有效ID（有序）
+        self.gaps = []  # 簇内相邻有效ID的间距
+        self.frontier = deque()  # 有效ID附近待检测的ID，优先于粗采样
+        self.coarse = range(start_id, end_id + 1, self.stride)
+        self.cursor = 0
+        self.passes = 1
+        self.samples = set()  # 本轮作为采样点派发的ID
+        self.pass_hits = 0  # 其中有效的个数
+        for id_num in seeds:
+            self.observe(id_num, True)
+
+    @property
+    def pending(self) -> int:
+        """可能还要派发的目标数（有请求进行中时其结果可能产生新目标，本轮结束后可能还要加密采样）"""
+        pending = len(self.frontier) + (len(self.coarse) - self.cursor) + self.running
+        return pending or int(self.can_refine())
+
+    @property
+    def radius(self) -> int:
+        if not self.gaps:
+            return self.min_radius
+        gaps = sorted(self.gaps)
+        return max(self.min_radius, min(self.stride, 2 * int(percentile(gaps, 90))))
+
+    def next(self):
+        if self.inflight[self.host] >= self.host_limit(self.host):
+            return None
+        id_num = self._next_id()
+        if id_num is None:
+            return None
+        self.probed.add(id_num)
+        self.inflight[self.host] += 1
+        self.running += 1
+        return id_num
+
+    def _next_id(self):
+        while self.frontier:
+            id_num = self.frontier.popleft()
+            if self._fresh(id_num):
+                return id_num
+        while self.cursor < len(self.coarse):
+            id_num = self.coarse[self.cursor]
+            self.cursor += 1
+            if self._fresh(id_num):
+                self.samples.add(id_num)
+                return id_num
+        # 本轮已全部完成（没有进行中的请求）时才根据学到的簇宽度决定是否加密
+        if not self.running and self.refine():
+            return self._next_id()
+        return None
+
+    def _fresh(self, id_num: int) -> bool:
+        return id_num not in self.probed and not self.is_done(id_num)
+
+    def observe(self, id_num: int, valid: bool):
+        """记录一个检测结果，有效时把两侧radius以内的ID加入待检测队列"""
+        if not valid:
+            return
+        index = bisect.bisect_left(self.hits, id_num)
+        if index < len(self.hits) and self.hits[index] == id_num:
+            return
+        if id_num in self.samples:
+            self.pass_hits += 1
+        for neighbour in self.hits[max(0, index - 1):index + 1]:
+            gap = abs(neighbour - id_num)
+            if gap <= self.stride:
+                self.gaps.append(gap)
+        self.hits.insert(index, id_num)
+        radius = self.radius
+        for offset in range(1, radius + 1):
+            for candidate in (id_num - offset, id_num + offset):
+                if self.start_id <= candidate <= self.end_id and candidate not in self.probed:
+                    self.frontier.append(candidate)
+
+    def clusters(self) -> List[tuple]:
+        """按当前radius把有效ID分成簇，返回[(首ID, 末ID, 有效数)]"""
+        clusters = []
+        radius = self.radius
+        for id_num in self.hits:
+            if clusters and id_num - clusters[-1][1] <= radius:
+                first, _, count = clusters[-1]
+                clusters[-1] = (first, id_num, count + 1)
+            else:
+                clusters.append((id_num, id_num, 1))
+        return clusters
+
+    def can_refine(self) -> bool:
+        """
+        上一轮采样点命中过有效ID时还可以加密；一轮采样全部落空说明该步长下已看不到新的簇
+        """
+        return self.stride // 2 >= self.min_stride and self.pass_hits > 0
+
+    def refine(self) -> bool:
+        """步长减半，在上一轮采样点之间再采样一轮"""
+        if not self.can_refine():
+            return False
+        self.stride //= 2
+        self.coarse = range(self.start_id + self.stride, self.end_id + 1, self.stride * 2)
+        self.cursor = 0
+        self.passes += 1
+        self.samples.clear()
+        self.pass_hits = 0
+        return True
+
+    def report(self) -> Dict:
+        """
+        覆盖率和置信度：宽度为w的簇被步长s的采样命中的概率约为min(1, w/s)，
+        用它对每个已发现簇加权（Horvitz-Thompson估计）估算有效ID总数，发现率 = 已发现 / 估计总数
+        估计只覆盖同类的簇：比步长窄、一个都没被发现的簇不在其中，实际发现率可能更低
+        """
+        total = self.end_id - self.start_id + 1
+        clusters = self.clusters()
+        estimated = sum(count / min(1.0, (last - first + 1) / self.stride) for first, last, count in clusters)
+        return {
+            'probed': len(self.probed),
+            'coverage': round(len(self.probed) / total, 4) if total else 0,
+            'found': len(self.hits),
+            'clusters': len(clusters),
+            'stride': self.stride,
+            'passes': self.passes,
+            'estimated_total': round(estimated),
+            'confidence': round(len(self.hits) / estimated, 3) if estimated else 0,
+        }
+
+
+class HostRateState:
+    """单个主机的自适应限速状态"""
+    __slots__ = ('limit', 'inflight', 'samples', 'baseline', 'backoff', 'slow_start', 'since_adjust',
+                 'decreased_at')
+
+    def __init__(self, limit: float, window: int):
+        self.limit = limit
+        self.inflight = 0
+        self.samples = deque(maxlen=window)  # (延迟, 错误类型)
+        self.baseline = 0.0  # 健康时的p50延迟
+        self.backoff = 0.0  # 每个请求发出前的等待秒数
+        self.slow_start = True
+        self.since_adjust = 0
+        self.decreased_at = 0.0  # 上次降并发的时间，之前发出的请求不再计入
+
+
+class AdaptiveRateController:
+    """
+    按主机自适应调节并发（类似TCP的AIMD）
+    观察滚动窗口内的延迟分位数和错误率：服务器变慢、超时或返回429/503时并发减半，
+    并发已降到最低仍然过载时增加请求间的退避；恢复健康后先翻倍（慢启动）再逐个加回并发
+    """
+
+    # 视为服务器压力信号的错误类型
+    pressure_errors = ('throttle', 'server', 'timeout', 'connect')
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: int = 4,
+                 window: int = 100, error_threshold: float = 0.1, latency_factor: float = 3.0,
+                 latency_slack: float = 0.2, max_backoff: float = 5.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.initial_limit = max(min_limit, min(initial_limit, max_limit))
+        self.window = window
+        self.error_threshold = error_threshold
+        self.latency_factor = latency_factor
+        self.latency_slack = latency_slack  # p90比基准至少慢这么多秒才算变慢，避免毫秒级抖动误判
+        self.max_backoff = max_backoff
+        self.hosts = {}
+        self.logger = logging.getLogger(__name__)
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def classify(result: ProbeResult):
+        """把探测结果归类为服务器压力信号，正常响应（包括404）返回None"""
+        kind = error_class(result)
+        if kind in ('http_429', 'http_503'):
+            return 'throttle'
+        if kind.startswith('http_5'):
+            return 'server'
+        if kind == 'timeout':
+            return 'timeout'
+        if kind in ('refused', 'dns', 'connection', 'other'):
+            return 'connect'
+        return None
+
+    def _state(self, host: str) -> HostRateState:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostRateState(self.initial_limit, self.window)
+        return state
+
+    def limit(self, host: str) -> int:
+        """主机当前的并发额度"""
+        with self._cond:
+            return int(self._state(host).limit)
+
+    def try_acquire(self, host: str):
+        """有空闲并发额度时占用一个并返回需要等待的退避秒数，否则返回None"""
+        with self._cond:
+            state = self._state(host)
+            if state.inflight >= int(state.limit):
+                return None
+            state.inflight += 1
+            return state.backoff
+
+    def acquire(self, host: str):
+        """线程版本：等待并发额度，再按当前退避时间等待"""
+        with self._cond:
+            while True:
+                backoff = self.try_acquire(host)
+                if backoff is not None:
+                    break
+                self._cond.wait(0.5)
+        if backoff:
+            time.sleep(backoff)
+
+    async def acquire_async(self, host: str):
+        """asyncio版本的acquire"""
+        while True:
+            backoff = self.try_acquire(host)
+            if backoff is not None:
+                break
+            await asyncio.sleep(0.02)
+        if backoff:
+            await asyncio.sleep(backoff)
+
+    def release(self, host: str, result: ProbeResult):
+        """记录一次请求的结果，并按需要调整并发"""
+        with self._cond:
+            state = self._state(host)
+            state.inflight -= 1
+            latency = result.response_time
+            if not result.cached and time.time() - latency >= state.decreased_at:
+                state.samples.append((latency, self.classify(result)))
+                state.since_adjust += 1
+                if state.since_adjust >= max(10, int(state.limit)):
+                    self._adjust(host, state)
+            self._cond.notify_all()
+
+    def _adjust(self, host: str, state: HostRateState):
+        state.since_adjust = 0
+        samples = list(state.samples)
+        errors = [kind for _, kind in samples if kind in self.pressure_errors]
+        error_rate = len(errors) / len(samples)
+        latencies = sorted(latency for latency, kind in samples if kind is None)
+        p50 = percentile(latencies, 50)
+        p90 = percentile(latencies, 90)
+        if p50 and (not state.baseline or p50 < state.baseline):
+            state.baseline = p50
+        
+        slow = (state.baseline and p90 > state.baseline * self.latency_factor
+                and p90 - state.baseline > self.latency_slack)
+        old_limit = state.limit
+        if 'throttle' in errors or error_rate > self.error_threshold or slow:
+            # 乘性减：并发减半；并发已降到最低时再加倍退避
+            state.slow_start = False
+            if state.limit <= self.min_limit:
+                state.backoff = min(self.max_backoff, max(0.1, state.backoff * 2))
+            state.limit = max(self.min_limit, state.limit / 2)
+            state.samples.clear()
+            state.decreased_at = time.time()
+            # 降并发前已发出的请求还会陆续返回错误，至少等一个旧并发窗口再做下次调整
+            state.since_adjust = -int(old_limit)
+            reason = f"错误率 {error_rate:.0%}" if errors else f"p90延迟 {p90:.2f}s"
+            self.logger.warning(f"⚠️ {host} 服务器压力过大 ({reason})，并发 {int(old_limit)} → {int(state.limit)}，退避 {state.backoff:.2f}s")
+        else:
+            # 加性增：慢启动阶段翻倍，之后每个窗口加1
+            state.limit = min(self.max_limit, state.limit * 2 if state.slow_start else state.limit + 1)
+            state.backoff = state.backoff / 2 if state.backoff > 0.05 else 0.0
+            if int(state.limit) != int(old_limit):
+                self.logger.debug(f"{host} 并发 {int(old_limit)} → {int(state.limit)}")
+
+    def summary(self) -> Dict:
+        """各主机当前的并发上限、退避和基准延迟"""
+        with self._cond:
+            return {
+                host: {
+                    'limit': int(state.limit),
+                    'backoff': round(state.backoff, 2),
+                    'baseline': round(state.baseline, 3),
+                }
+                for host, state in self.hosts.items()
+            }
+
+
+class OriginProfile:
+    """单个源站（协议+主机+端口）学到的请求能力"""
+    __slots__ = ('head', 'head_trials', 'head_agreed', 'head_found', 'head_statuses', 'range', 'probes', 'hits')
+
+    def __init__(self):
+        self.head = None  # None 试探中，True 可以用HEAD排除无效地址，False 不使用HEAD
+        self.head_trials = 0  # 试探阶段HEAD和GET都发出的次数
+        self.head_agreed = 0  # 其中HEAD和GET返回相同错误状态码的次数
+        self.head_found = 0  # 其中HEAD和GET都成功的次数（确认HEAD不会把有效地址误判为无效）
+        self.head_statuses = set()  # HEAD与GET一致的错误状态码，只有这些状态码可以直接用HEAD判定
+        self.range = None  # None 未知，True 支持Range（返回206），False 忽略或拒绝Range
+        self.probes = 0
+        self.hits = 0
+
+
+class ProbePlan:
+    """一次探测的请求方式：请求的地址、请求头，以及是否先发HEAD"""
+    __slots__ = ('profile', 'url', 'target', 'base_headers', 'headers', 'head', 'head_status', 'ranged',
+                 'validators')
+
+    def __init__(self, profile: OriginProfile, url: str, headers: Dict = None):
+        self.profile = profile
+        self.url = url
+        self.target = url  # 实际请求的地址（可能是缓存的跳转目标）
+        self.base_headers = headers
+        self.headers = headers
+        self.head = False
+        self.head_status = None
+        self.ranged = False
+        self.validators = ()  # 条件请求头 (If-None-Match, If-Modified-Since)
+
+
+class OriginCapabilities:
+    """按源站学习请求方式（HEAD、Range、条件请求、缓存的跳转目标），线程池和asyncio引擎共用"""
+
+    ok_statuses = (200, 206, 304)
+    unsupported_statuses = (405, 501)  # HEAD返回这些状态码说明源站不支持HEAD
+
+    def __init__(self, range_bytes: int = 64 * 1024, head_trials: int = 3, max_head_trials: int = 50,
+                 max_urls: int = 100000):
+        self.range_bytes = range_bytes
+        self.head_trials = head_trials  # HEAD与GET错误状态码一致这么多次后开始使用HEAD
+        self.max_head_trials = max_head_trials  # 试探这么多次仍未确认时放弃HEAD
+        self.max_urls = max_urls  # 最多记住的地址数（跳转目标和ETag），超过后先忘记最早的
+        self.origins = {}  # "http://主机:端口" -> OriginProfile
+        self.counters = {'head': 0, 'head_rejected': 0, 'ranged': 0, 'not_modified': 0,
+                         'redirect_cached': 0, 'fallback': 0}
+        self._urls = {}  # 地址 -> (跳转目标, ETag, Last-Modified, 上次有效结果)
+        self._lock = threading.Lock()
+
+    def profile(self, url: str) -> OriginProfile:
+        """URL所在源站的能力记录"""
+        key = '/'.join(url.split('/', 3)[:3]).lower()
+        profile = self.origins.get(key)
+        if profile is None:
+            with self._lock:
+                profile = self.origins.setdefault(key, OriginProfile())
+        return profile
+
+    def plan(self, url: str, headers: Dict = None, head: bool = False) -> ProbePlan:
+        """按已学到的能力决定这次探测怎么发请求；head为False时从不先发HEAD"""
+        profile = self.profile(url)
+        plan = ProbePlan(profile, url, headers)
+        known = self._urls.get(url)
+        if known:
+            target, etag, modified, snapshot = known
+            if target:
+                plan.target = target
+                self._count('redirect_cached')
+            if snapshot:
+                plan.validators = (etag, modified)
+        else:
+            # 已知有效的地址直接发GET；只有有效率低的源站才值得先发HEAD（包括试探）
+            plan.head = head and profile.head is not False and profile.hits * 2 <= profile.probes
+        plan.ranged = profile.range is not False
+        self._build_headers(plan)
+        return plan
+
+    def _build_headers(self, plan: ProbePlan):
+        headers = dict(plan.base_headers) if plan.base_headers else {}
+        etag, modified = plan.validators or (None, None)
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        if plan.ranged:
+            headers['Range'] = f"bytes=0-{self.range_bytes - 1}"
+        plan.headers = headers or None
+
+    def head_verdict(self, plan: ProbePlan, status: int) -> bool:
+        """HEAD的状态码是否足以判定地址无效；返回False时还需要发GET"""
+        profile = plan.profile
+        with self._lock:
+            self.counters['head'] += 1
+            plan.head_status = status
+            if status in self.unsupported_statuses:
+                profile.head = False
+                return False
+            if profile.head and status in profile.head_statuses:
+                self.counters['head_rejected'] += 1
+                return True
+        return False
+
+    def fallback(self, plan: ProbePlan, status: int) -> bool:
+        """
+        请求缓存的跳转目标或带Range的请求失败时改回普通请求，返回True表示需要重试一次
+        """
+        profile = plan.profile
+        with self._lock:
+            if plan.target != plan.url and status not in self.ok_statuses:
+                self._urls.pop(plan.url, None)
+                plan.target = plan.url
+                plan.validators = ()
+            elif plan.ranged and profile.range is None and status in (400, 416):
+                profile.range = False
+                plan.ranged = False
+            else:
+                return False
+            self.counters['fallback'] += 1
+        self._build_headers(plan)
+        return True
+
+    def not_modified(self, plan: ProbePlan, result: ProbeResult) -> bool:
+        """304响应时沿用上次有效的结果，没有记录时返回False"""
+        known = self._urls.get(plan.url)
+        if not known or not known[3]:
+            return False
+        result.valid = True
+        (result.channel_name, result.content_type, result.content_length,
+         result.fingerprint, result.seq_offset) = known[3]
+        self._count('not_modified')
+        return True
+
+    def learn(self, plan: ProbePlan, status: int, headers, final_url: str, result: ProbeResult):
+        """请求完成后更新源站能力，并记住地址的跳转目标和ETag/Last-Modified"""
+        profile = plan.profile
+        with self._lock:
+            profile.probes += 1
+            profile.hits += result.valid
+            if profile.head is None and plan.head_status is not None:
+                self._learn_head(profile, plan.head_status, status)
+            if plan.ranged and status in (200, 206):
+                if profile.range is None:
+                    profile.range = status == 206
+                if status == 206:
+                    self.counters['ranged'] += 1
+            if status == 304:
+                return
+            target = final_url if final_url and final_url != plan.url else None
+            etag = headers.get('etag') if result.valid else None
+            modified = headers.get('last-modified') if result.valid else None
+            if result.valid and (target or etag or modified):
+                snapshot = None
+                if etag or modified:
+                    snapshot = (result.channel_name, result.content_type, result.content_length,
+                                result.fingerprint, result.seq_offset)
+                self._urls.pop(plan.url, None)
+                self._urls[plan.url] = (target, etag, modified, snapshot)
+                if len(self._urls) > self.max_urls:
+                    del self._urls[next(iter(self._urls))]
+            elif plan.url in self._urls:
+                del self._urls[plan.url]
+
+    def _learn_head(self, profile: OriginProfile, head_status: int, get_status: int):
+        profile.head_trials += 1
+        head_ok = 200 <= head_status < 300
+        if not head_ok and get_status in self.ok_statuses:
+            # HEAD报错而GET成功，HEAD不可信
+            profile.head = False
+            return
+        if head_ok and get_status in self.ok_statuses:
+            profile.head_found += 1
+        elif not head_ok and head_status == get_status:
+            profile.head_agreed += 1
+            profile.head_statuses.add(head_status)
+        if profile.head_agreed >= self.head_trials and profile.head_found:
+            profile.head = True
+        elif profile.head_trials >= self.max_head_trials:
+            profile.head = False
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def summary(self) -> Dict:
+        """请求方式统计，以及各源站学到的HEAD和Range支持情况"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'origins': {origin: {'head': profile.head, 'range': profile.range}
+                            for origin, profile in self.origins.items()},
+            }
+
 
 class IDRangeScanner:
     def __init__(self, timeout=5, max_workers=20):
         self.timeout = timeout
         self.max_workers = max_workers
-        self.found_channels = []
+        self.sink = None
+        self.sink_format = "jsonl"  # 增量结果格式: jsonl / csv
+        self.probe_cache = None
+        self.probe_bytes = 2048  # 判断是否为M3U8时读取的最大字节数
+        self.max_playlist_bytes = 256 * 1024  # 提取频道名称时最多读取的字节数
+        self.drain_limit = 64 * 1024  # 剩余响应体不超过该大小时读完以复用连接
+        self.origin_probing = True  # 按源站能力选择Range、条件请求和缓存的跳转目标，见OriginCapabilities
+        self.head_probing = False  # 有效率低的源站先发HEAD排除无效地址（需开启origin_probing）
+        self.origins = OriginCapabilities(self.drain_limit)
+        self.engine = "threads"  # 扫描引擎: threads / asyncio
+        self.per_host_limit = 32  # asyncio引擎单主机最大连接数
+        self.requests_per_second = 0  # asyncio引擎每秒最大请求数，0为不限制
+        self.adaptive = False  # 按服务器延迟和错误率自动调节并发
+        self.rate_controller = None
+        self.result_listeners = []  # 每个探测结果都会传给这些回调（用于统计）
+        self.metrics = ScanMetrics()
+        self.metrics_file = None  # 扫描期间定期刷新的指标文件（.json 或 .prom）
+        self.profile_file = None  # 设置后用cProfile分析扫描过程并保存统计
+        self.profiler = None
+        self._templates = {}  # (基础URL, 网络模式) -> URLTemplate
+        self._pool_size = None  # 当前连接池大小 (主机数, 每主机连接数)
+        self.connection_stats = {'new': 0, 'reused': 0}  # 最近一次扫描的连接复用统计
+        self.keep_params = None  # 列表去重时只比较这些查询参数（frozenset），None为全部比较
+        self.deep_probe = False  # 扫描结束后对有效频道测量首个分片的实际下载速度
+        self.deep_probe_bytes = 1024 * 1024  # 深度检测每个分片最多下载的字节数
+        self.deep_probe_seconds = 5  # 深度检测每个分片最多下载的时间
+        self.deep_probe_workers = 4  # 深度检测并发数，避免多个分片下载互相抢带宽
+        self.export_formats = ('txt', 'detail')  # 保存结果时生成的格式，见EXPORT_FORMATS
+        self.merge_duplicates = False  # 保存时把内容指纹相同的地址合并为一个频道，最快的为主地址，其余为备用
+        self.fingerprint_window = 3.0  # 序号偏移相差不超过这么多个分片视为同一路流
+        self.scan_strategy = "exhaustive"  # exhaustive 逐个扫描全部ID，sparse 稀疏探索（见SparseExplorer）
+        self.explore_stride = 16  # 稀疏探索的初始采样步长
+        self.explore_min_stride = None  # 稀疏探索加密采样的最小步长，None为初始步长的1/4，等于初始步长时不加密
+        self.shard_processes = 0  # 大于0时使用分片扫描，本机启动这么多个工作进程
+        self.shard_listen = ('127.0.0.1', 0)  # 分片协调服务监听地址
+        self.shard_token = ''  # 其它机器加入分片扫描时需要提供的令牌
         self.output_dir = ""
+        self.writable_dirs = None  # 可写入目录的检测结果，多次扫描只检测一次
         self.network_mode = "dual_stack"  # 默认双栈模式
         
+        self.resolver = HostResolver()  # DNS缓存和Happy Eyeballs连接，线程池和asyncio引擎共用
+        
         # 先初始化日志
         self.setup_logging()
         
@@ -29,6 +2625,34 @@ class IDRangeScanner:
             'Accept': '*/*',
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
         })
+        self.configure_connection_pool()
+
+    def configure_connection_pool(self, hosts: int = 1):
+        """
+        按并发数设置连接池：每个主机保留max_workers个keep-alive连接，避免默认的10个连接不够用
+        导致连接被丢弃重建（"Connection pool is full"）
+        :param hosts: 需要同时保持连接池的主机数量
+        """
+        size = (max(10, hosts), max(10, self.max_workers))
+        if size == self._pool_size:
+            return
+        self._pool_size = size
+        adapter = ResolvingHTTPAdapter(self.resolver, pool_connections=size[0], pool_maxsize=size[1])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def pool_counters(self) -> Dict:
+        """累计的新建连接数和请求数（来自urllib3各主机连接池）"""
+        new = requests_total = 0
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    new += pool.num_connections
+                    requests_total += pool.num_requests
+        return {'new': new, 'requests': requests_total}
 
     def setup_logging(self):
         """设置日志"""
@@ -38,53 +2662,65 @@ class IDRangeScanner:
         )
         self.logger = logging.getLogger(__name__)
 
+    @property
+    def found_channels(self) -> List[Dict]:
+        """已发现的有效频道（从结果文件读回）"""
+        return list(self.sink) if self.sink else []
+
+    def find_checkpoint(self, base_url: str):
+        """查找保存目录中该URL模式的断点记录，没有则返回None"""
+        checkpoint = ScanCheckpoint(ScanCheckpoint.path_for(self.output_dir, base_url), base_url)
+        if checkpoint.load() and checkpoint.starts:
+            return checkpoint
+        return None
+
+    def enable_probe_cache(self, filepath: str = None, positive_ttl: float = 6 * 3600,
+                           negative_ttl: float = 3600, max_entries: int = 500000) -> ProbeCache:
+        """启用探测结果缓存，默认缓存文件放在保存目录中"""
+        if self.probe_cache:
+            self.probe_cache.close()
+        if not filepath:
+            filepath = os.path.join(self.output_dir, ".探测缓存.sqlite")
+        self.probe_cache = ProbeCache(filepath, positive_ttl, negative_ttl, max_entries)
+        self.logger.info(f"已启用探测缓存: {filepath} (有效结果{positive_ttl / 3600:g}小时, 无效结果{negative_ttl / 3600:g}小时)")
+        return self.probe_cache
+
+    def open_sink(self, filename: str = None, append: bool = False) -> ResultSink:
+        """在保存目录中创建增量结果文件"""
+        if self.sink:
+            self.sink.close()
+        sink_cls = RESULT_SINKS.get(self.sink_format, JsonlResultSink)
+        if not filename:
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            filename = f"扫描结果_{timestamp}{sink_cls.extension}"
+        self.sink = sink_cls(os.path.join(self.output_dir, filename)).open(append)
+        self.logger.info(f"结果实时写入: {self.sink.filepath}")
+        return self.sink
+
     def setup_network(self, network_mode="dual_stack"):
         """
-        设置网络模式
+        设置网络模式（只影响本扫描器的解析器，不修改全局的urllib3设置）
         :param network_mode: ipv4, ipv6, dual_stack
         """
         self.network_mode = network_mode
+        self.resolver.set_mode(network_mode)
         
         if network_mode == "ipv6":
-            # 强制使用IPv6
-            def _allowed_gai_family():
-                return socket.AF_INET6
-            urllib3_connection.allowed_gai_family = _allowed_gai_family
-            if hasattr(self, 'logger'):
-                self.logger.info("已启用IPv6 only模式")
-            else:
-                print("✅ 已启用IPv6 only模式")
-            
+            message = "已启用IPv6 only模式"
         elif network_mode == "ipv4":
-            # 强制使用IPv4
-            def _allowed_gai_family():
-                return socket.AF_INET
-            urllib3_connection.allowed_gai_family = _allowed_gai_family
-            if hasattr(self, 'logger'):
-                self.logger.info("已启用IPv4 only模式")
-            else:
-                print("✅ 已启用IPv4 only模式")
-            
+            message = "已启用IPv4 only模式"
         else:
-            # 双栈模式 (IPv6优先)
-            def _allowed_gai_family():
-                family = socket.AF_INET
-                try:
-                    # 检查系统是否支持IPv6
-                    socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                    # 优先尝试IPv6，失败时回退到IPv4
-                    family = socket.AF_INET6
-                except:
-                    family = socket.AF_INET
-                return family
-            urllib3_connection.allowed_gai_family = _allowed_gai_family
-            if hasattr(self, 'logger'):
-                self.logger.info("已启用双栈模式 (IPv6优先)")
-            else:
-                print("✅ 已启用双栈模式 (IPv6优先)")
+            # 同时解析IPv6和IPv4，按Happy Eyeballs竞速连接，IPv6优先
+            message = "已启用双栈模式 (IPv6优先, Happy Eyeballs)"
+        if hasattr(self, 'logger'):
+            self.logger.info(message)
+        else:
+            print(f"✅ {message}")
 
     def get_writable_directories(self):
-        """获取可写入的目录列表"""
+        """获取可写入的目录列表（结果会缓存，继续扫描其它范围时不再重复检测）"""
+        if self.writable_dirs is not None:
+            return self.writable_dirs
         writable_dirs = []
         
         # 可能的可写入目录
@@ -114,6 +2750,7 @@ class IDRangeScanner:
             else:
                 print(f"❌ 不可写: {dir_path}")
         
+        self.writable_dirs = writable_dirs
         return writable_dirs
 
     def test_directory_write(self, dir_path):
@@ -195,7 +2832,7 @@ class IDRangeScanner:
                 print("请输入有效的数字")
         
         # 获取基础URL
-        print("\n请输入要扫描的基础URL（用 {} 表示ID位置）：")
+        print("\n请输入要扫描的基础URL（用 {} 表示ID位置，需要补零时用 {:05d} 这样的格式）：")
         print("示例1 (IPv4): http://example.com/PLTV/11/224/{}/index.m3u8")
         print("示例2 (IPv6): http://[2409:8087:1e01:20::28]/PLTV/11/224/322122{}/1.m3u8")
         print("注意：IPv6地址必须用方括号 [] 括起来")
@@ -205,8 +2842,10 @@ class IDRangeScanner:
             if not base_url:
                 print("URL不能为空，请重新输入")
                 continue
-            if "{}" not in base_url:
-                print("URL中必须包含 {} 来表示ID位置")
+            try:
+                URLTemplate(base_url).render(0)
+            except ValueError as e:
+                print(f"❌ {e}")
                 continue
             
             # 验证IPv6地址格式
@@ -235,20 +2874,40 @@ class IDRangeScanner:
             except ValueError:
                 print("请输入有效的数字")
         
+        # 扫描引擎
+        print("\n⚙️ 扫描引擎:")
+        print("1. 线程池 (默认)")
+        print("2. asyncio (单线程高并发，可限制单主机连接数和每秒请求数)")
+        self.engine = "asyncio" if input("选择扫描引擎 (1-2, 默认1): ").strip() == "2" else "threads"
+        max_allowed = 1000 if self.engine == "asyncio" else 100
+        
         # 获取线程数
         while True:
             try:
-                workers = input(f"并发线程数 (默认{self.max_workers}): ").strip()
+                workers = input(f"并发数 (默认{self.max_workers}): ").strip()
                 if workers:
                     workers = int(workers)
-                    if 1 <= workers <= 100:
+                    if 1 <= workers <= max_allowed:
                         self.max_workers = workers
                     else:
-                        print("线程数应在1-100之间")
+                        print(f"并发数应在1-{max_allowed}之间")
                 break
             except ValueError:
                 print("请输入有效的数字")
         
+        if self.engine == "asyncio":
+            while True:
+                try:
+                    limit = input(f"单主机最大连接数 (默认{self.per_host_limit}): ").strip()
+                    if limit:
+                        self.per_host_limit = max(1, int(limit))
+                    rps = input(f"每秒最大请求数 (默认{self.requests_per_second}，0为不限制): ").strip()
+                    if rps:
+                        self.requests_per_second = max(0.0, float(rps))
+                    break
+                except ValueError:
+                    print("请输入有效的数字")
+        
         # 获取超时时间
         while True:
             try:
@@ -259,44 +2918,65 @@ class IDRangeScanner:
             except ValueError:
                 print("请输入有效的数字")
         
+        # 自适应限速
+        self.adaptive = input("启用自适应限速，服务器变慢或限流时自动降低并发？(y/n, 默认n): ").strip().lower() == 'y'
+        
+        # 探测结果缓存
+        if input("使用探测结果缓存，跳过近期已检查过的ID？(y/n, 默认n): ").strip().lower() == 'y':
+            self.enable_probe_cache()
+        
+        # 扫描策略
+        if input("使用稀疏探索（按步长采样，在发现的频道附近加密，请求更少但可能漏掉孤立的ID）？(y/n, 默认n): ").strip().lower() == 'y':
+            self.scan_strategy = "sparse"
+            while True:
+                try:
+                    stride = input(f"采样步长 (默认{self.explore_stride}): ").strip()
+                    if stride:
+                        self.explore_stride = max(2, int(stride))
+                    min_stride = input(f"最小步长，发现频道后逐轮减半加密到该步长 "
+                                       f"(默认{max(1, self.explore_stride // 4)}，等于采样步长则不加密): ").strip()
+                    if min_stride:
+                        self.explore_min_stride = max(1, min(self.explore_stride, int(min_stride)))
+                    break
+                except ValueError:
+                    print("请输入有效的数字")
+        
+        # 深度检测
+        self.deep_probe = input("扫描结束后测量有效频道的分片下载速度（按实测速度排序）？(y/n, 默认n): ").strip().lower() == 'y'
+        
+        # 内容去重
+        default = 'y' if self.merge_duplicates else 'n'
+        merge = input(f"保存时把内容相同的地址合并为一个频道（其余作为备用地址）？(y/n, 默认{default}): ").strip().lower()
+        if merge in ('y', 'n'):
+            self.merge_duplicates = merge == 'y'
+        
         return base_url, start_id, end_id
 
     def has_ipv6_address(self, url: str) -> bool:
-        """检查URL是否包含IPv6地址"""
-        ipv6_pattern = r'[0-9a-fA-F:]+:[0-9a-fA-F:]+'
-        return bool(re.search(ipv6_pattern, url))
+        """检查URL的主机部分是否为IPv6地址（IPv4地址带端口号不算）"""
+        return bool(find_ipv6(url_authority(url)))
+
+    def url_template(self, base_url: str) -> "URLTemplate":
+        """取基础URL对应的预解析模板，每个URL模式只解析一次"""
+        key = (base_url, self.network_mode)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = URLTemplate(base_url, self.network_mode)
+        return template
 
     def generate_url(self, base_url: str, id_num: int) -> str:
         """根据ID生成完整URL，处理IPv6地址的特殊情况"""
-        try:
-            # 直接格式化
-            url = base_url.format(id_num)
-            
-            # 对于包含IPv6地址的URL，确保格式正确
-            if self.has_ipv6_address(url):
-                # 检查IPv6地址是否被正确括在方括号中
-                if '[' not in url and ']' not in url:
-                    # 提取IPv6地址并添加方括号
-                    ipv6_match = re.search(r'([0-9a-fA-F:]+:[0-9a-fA-F:]+)', url)
-                    if ipv6_match:
-                        ipv6_addr = ipv6_match.group(1)
-                        # 替换为带方括号的格式
-                        url = url.replace(ipv6_addr, f'[{ipv6_addr}]')
-            
-            return url
-        except Exception as e:
-            self.logger.error(f"生成URL失败: {str(e)}")
-            return base_url.format(id_num)
+        return self.url_template(base_url).render(id_num)
 
     def extract_channel_name(self, url: str, content: str = "") -> str:
         """尝试从URL或内容中提取频道名称"""
         # 从M3U8内容中提取
         if content and '#EXTINF' in content:
-            extinf_match = re.search(r'#EXTINF:.*?,(.+?)\n', content)
+            extinf_match = EXTINF_NAME_PATTERN.search(content)
             if extinf_match:
                 name = extinf_match.group(1).strip()
                 # 清理名称中的特殊字符
-                name = re.sub(r'[<>:"/\\|?*]', '', name)
+                name = INVALID_NAME_CHARS.sub('', name)
                 if name and name != "-":
                     return name
         
@@ -309,162 +2989,1227 @@ class IDRangeScanner:
                 return f"{part}"
         
         # 尝试从ID部分提取
-        id_match = re.search(r'322122(\d+)/1\.m3u8', url)
+        id_match = PLTV_ID_PATTERN.search(url)
         if id_match:
             return f"ID_{id_match.group(1)}"
         
         # 默认使用ID作为名称
-        id_match = re.search(r'/(\d+)/[^/]*\.m3u8', url)
+        id_match = NUMERIC_ID_PATTERN.search(url)
         if id_match:
             return f"频道_{id_match.group(1)}"
         
         return "直播频道"
 
-    def check_single_id(self, base_url: str, id_num: int) -> Dict:
+    def prepare_probe(self, base_url: str, id_num: int):
+        """
+        生成URL和结果结构；命中缓存或URL格式错误时结果已确定，无需网络请求
+        :return: (结果, 是否已确定)
+        """
+        template = self.url_template(base_url)
+        result = self.new_result(id_num, template.render(id_num), template.ip_version)
+        
+        # 对于IPv6 URL，验证是否有方括号
+        if template.error:
+            result.code = ProbeError.BAD_URL
+            return result, True
+        
+        return self.lookup_cache(result)
+
+    def prepare_url_probe(self, url: str, id_num: int = 0):
+        """
+        为列表中已有的完整URL生成结果结构（用于批量检测）；
+        非.m3u8/.m3u地址（组播转发、FLV等直连流）只要能返回数据就视为有效
+        :return: (结果, 是否已确定)
+        """
+        result = self.new_result(id_num, url, self.get_ip_version_from_url(url))
+        if not url.lower().startswith(('http://', 'https://')):
+            result.code = ProbeError.UNSUPPORTED
+            return result, True
+        path = urlsplit(url).path.lower()
+        result.accept_stream = not path.endswith(('.m3u8', '.m3u'))
+        return self.lookup_cache(result)
+
+    def new_result(self, id_num: int, url: str, ip_version: str) -> ProbeResult:
+        """探测结果的初始结构"""
+        return ProbeResult(id_num, url, ip_version)
+
+    def lookup_cache(self, result: ProbeResult):
+        """先查缓存，命中时不发起网络请求"""
+        if self.probe_cache:
+            cached = self.probe_cache.get(result.url)
+            if cached:
+                del cached['checked_at']
+                result.update(cached)
+                result.cached = True
+                return result, True
+        
+        return result, False
+
+    def check_single_id(self, base_url: str, id_num: int) -> ProbeResult:
         """检查单个ID对应的直播源"""
-        url = self.generate_url(base_url, id_num)
-        result = {
-            'id': id_num,
-            'url': url,
-            'valid': False,
-            'channel_name': '',
-            'response_time': 0,
-            'content_type': '',
-            'content_length': 0,
-            'error': '',
-            'm3u8_content': '',
-            'ip_version': self.get_ip_version_from_url(url)
-        }
+        result, finished = self.prepare_probe(base_url, id_num)
+        if finished:
+            return result
+        return self.fetch_probe(result)
+
+    def check_url(self, url: str, id_num: int = 0, user_agent: str = '') -> ProbeResult:
+        """检查列表中的单个完整URL，返回与check_single_id相同结构的结果；user_agent为列表中指定的UA"""
+        result, finished = self.prepare_url_probe(url, id_num)
+        if finished:
+            return result
+        return self.fetch_probe(result, {'User-Agent': user_agent} if user_agent else None)
+
+    def fetch_probe(self, result: ProbeResult, headers: Dict = None) -> ProbeResult:
+        """发起请求并填写结果；开启origin_probing时按源站能力选择请求方式"""
+        url = result.url
         
         try:
-            # 对于IPv6 URL，进行特殊处理
-            if self.has_ipv6_address(url):
-                # 验证IPv6 URL格式
-                if '[' not in url or ']' not in url:
-                    result['error'] = 'IPv6地址格式错误，缺少方括号'
-                    return result
-            
             start_time = time.time()
+            plan = self.origins.plan(url, headers, self.head_probing) if self.origin_probing else None
+            
+            # HEAD已经判定无效时不再发GET
+            if not (plan and plan.head and self.head_rejects(plan, result, start_time)):
+                # 对于M3U8文件，直接使用GET请求；流式读取，不下载整个响应体
+                while True:
+                    response = self.session.get(plan.target if plan else url, timeout=self.timeout,
+                                                allow_redirects=True, stream=True,
+                                                headers=plan.headers if plan else headers)
+                    if plan and self.origins.fallback(plan, response.status_code):
+                        response.close()
+                        continue
+                    break
+                self.read_probe(result, plan, response, start_time)
+                
+        except requests.exceptions.RequestException as e:
+            result.code = ProbeError.of(e)
+        except Exception as e:
+            result.code = ProbeError.OTHER
+            self.logger.debug(f"检测 {url} 出错: {e}")
+        
+        if self.probe_cache:
+            self.probe_cache.put(result)
             
-            # 对于M3U8文件，直接使用GET请求
-            response = self.session.get(url, timeout=self.timeout, allow_redirects=True)
-            response_time = time.time() - start_time
+        return result
+
+    def head_rejects(self, plan: ProbePlan, result: ProbeResult, start_time: float) -> bool:
+        """先发HEAD；源站上HEAD可信的错误状态码直接判定无效并返回True，否则还需要GET"""
+        response = self.session.head(plan.target, timeout=self.timeout, allow_redirects=True,
+                                     headers=plan.base_headers)
+        response.close()
+        if not self.origins.head_verdict(plan, response.status_code):
+            return False
+        result.ip_version = self.connected_ip_version(result.url) or result.ip_version
+        result.status = response.status_code
+        result.code = ProbeError.HTTP
+        result.response_time = round(time.time() - start_time, 2)
+        self.origins.learn(plan, response.status_code, response.headers, response.url, result)
+        return True
+
+    def read_probe(self, result: ProbeResult, plan: ProbePlan, response, start_time: float):
+        """按GET响应填写结果（206按200处理，304沿用上次有效的结果）"""
+        url = result.url
+        metrics = self.metrics
+        headers_time = time.time()
+        result.ip_version = self.connected_ip_version(url) or result.ip_version
+        metrics.observe('ttfb', headers_time - start_time)
+        chunks = response.iter_content(chunk_size=self.probe_bytes)
+        try:
+            result.status = response.status_code
+            
+            if response.status_code in (200, 206):
+                # 检查是否是有效的M3U8文件
+                is_m3u8, content, size = self.read_playlist_head(response, chunks, start_time)
+                body_time = time.time()
+                metrics.observe('body', body_time - headers_time)
+                if is_m3u8:
+                    result.valid = True
+                    result.content_type = response.headers.get('content-type', '')
+                    result.content_length = size
+                    result.channel_name = self.extract_channel_name(url, content)
+                    result.fingerprint, result.seq_offset = playlist_fingerprint(content, start_time, response.url or url)
+                    metrics.observe('parse', time.time() - body_time)
+                elif result.accept_stream and size:
+                    result.valid = True
+                    result.content_type = response.headers.get('content-type', '')
+                    result.content_length = size
+                else:
+                    result.code = ProbeError.NOT_M3U8
+            elif not (response.status_code == 304 and plan and self.origins.not_modified(plan, result)):
+                result.code = ProbeError.HTTP
+            result.response_time = round(time.time() - start_time, 2)
+            if plan:
+                self.origins.learn(plan, response.status_code, response.headers, response.url, result)
+        finally:
+            self.release_response(response, chunks)
+
+    def is_m3u8_head(self, data: bytes) -> bool:
+        """响应体开头是否包含M3U8标记"""
+        return b'#EXTM3U' in data[:self.probe_bytes]
+
+    def needs_more_playlist(self, data: bytes) -> bool:
+        """是否还需要继续读取（尚未读到第一个#EXTINF及其分片URI行且未超过读取上限）"""
+        if len(data) >= self.max_playlist_bytes:
+            return False
+        pos = data.find(b'#EXTINF')
+        return pos < 0 or not SEGMENT_LINE_PATTERN.match(data, pos)
+
+    def read_playlist_head(self, response, chunks, start_time: float):
+        """
+        流式读取响应体：先读取前probe_bytes字节确认#EXTM3U，
+        确认有效后再继续读取到第一条完整的#EXTINF行（用于提取频道名称）
+        :return: (是否为M3U8, 已读取的文本, 内容长度)
+        """
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+            if len(data) >= self.probe_bytes:
+                break
+        
+        # 大文件或.ts流在这里直接判定无效，不再继续下载
+        if not self.is_m3u8_head(data):
+            return False, '', len(data)
+        
+        while self.needs_more_playlist(data) and time.time() - start_time < self.timeout:
+            chunk = next(chunks, None)
+            if not chunk:
+                break
+            data += chunk
+        
+        size = content_size(response.headers, len(data))
+        return True, data.decode(response.encoding or 'utf-8', errors='replace'), size
+
+    def release_response(self, response, chunks):
+        """剩余响应体较小时读完，让连接回到连接池复用；否则直接关闭连接"""
+        try:
+            length = response.headers.get('content-length', '')
+            if length.isdigit() and int(length) <= self.drain_limit:
+                for _ in chunks:
+                    pass
+        except Exception:
+            pass
+        finally:
+            response.close()
+
+    async def check_single_id_async(self, client: "AsyncHTTPClient", base_url: str, id_num: int) -> ProbeResult:
+        """check_single_id的asyncio版本，返回相同结构的结果"""
+        result, finished = self.prepare_probe(base_url, id_num)
+        if finished:
+            return result
+        return await self.fetch_probe_async(client, result)
+
+    async def check_url_async(self, client: "AsyncHTTPClient", url: str, id_num: int = 0,
+                              user_agent: str = '') -> ProbeResult:
+        """check_url的asyncio版本"""
+        result, finished = self.prepare_url_probe(url, id_num)
+        if finished:
+            return result
+        return await self.fetch_probe_async(client, result, {'User-Agent': user_agent} if user_agent else None)
+
+    async def fetch_probe_async(self, client: "AsyncHTTPClient", result: ProbeResult,
+                                headers: Dict = None) -> ProbeResult:
+        """fetch_probe的asyncio版本，整个请求受timeout限制"""
+        try:
+            await asyncio.wait_for(self._probe_async(client, result, headers), self.timeout)
+        except asyncio.TimeoutError:
+            result.code = ProbeError.TIMEOUT
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            result.code = ProbeError.of(e)
+        except Exception as e:
+            result.code = ProbeError.OTHER
+            self.logger.debug(f"检测 {result.url} 出错: {e}")
+        
+        if self.probe_cache:
+            self.probe_cache.put(result)
+        
+        return result
+
+    async def _probe_async(self, client: "AsyncHTTPClient", result: ProbeResult, headers: Dict = None):
+        """发起异步请求并按与check_single_id相同的规则填写结果"""
+        start_time = time.time()
+        plan = self.origins.plan(result.url, headers, self.head_probing) if self.origin_probing else None
+        if plan and plan.head:
+            head = await client.request('HEAD', plan.target, plan.base_headers)
+            await head.release()
+            if self.origins.head_verdict(plan, head.status):
+                result.ip_version = self.connected_ip_version(result.url) or result.ip_version
+                result.status = head.status
+                result.code = ProbeError.HTTP
+                result.response_time = round(time.time() - start_time, 2)
+                self.origins.learn(plan, head.status, head.headers, head.url, result)
+                return
+        while True:
+            response = await client.get(plan.target if plan else result.url, plan.headers if plan else headers)
+            if plan and self.origins.fallback(plan, response.status):
+                await response.release(self.drain_limit)
+                continue
+            break
+        headers_time = time.time()
+        result.ip_version = self.connected_ip_version(result.url) or result.ip_version
+        completed = False
+        try:
+            result.status = response.status
             
-            if response.status_code == 200:
-                # 检查是否是有效的M3U8文件
-                if '#EXTM3U' in response.text:
-                    result.update({
-                        'valid': True,
-                        'response_time': round(response_time, 2),
-                        'content_type': response.headers.get('content-type', ''),
-                        'content_length': len(response.text),
-                        'm3u8_content': response.text
-                    })
-                    result['channel_name'] = self.extract_channel_name(url, response.text)
+            if response.status in (200, 206):
+                data = bytearray()
+                while len(data) < self.probe_bytes:
+                    chunk = await response.read(self.probe_bytes - len(data))
+                    if not chunk:
+                        break
+                    data += chunk
+                
+                if self.is_m3u8_head(data):
+                    while self.needs_more_playlist(data):
+                        chunk = await response.read(self.probe_bytes)
+                        if not chunk:
+                            break
+                        data += chunk
+                    body_time = time.time()
+                    self.metrics.observe('body', body_time - headers_time)
+                    result.valid = True
+                    result.content_type = response.headers.get('content-type', '')
+                    result.content_length = content_size(response.headers, len(data))
+                    content = data.decode('utf-8', errors='replace')
+                    result.channel_name = self.extract_channel_name(result.url, content)
+                    result.fingerprint, result.seq_offset = playlist_fingerprint(content, start_time,
+                                                                                 response.url or result.url)
+                    self.metrics.observe('parse', time.time() - body_time)
+                elif result.accept_stream and data:
+                    self.metrics.observe('body', time.time() - headers_time)
+                    result.valid = True
+                    result.content_type = response.headers.get('content-type', '')
+                    result.content_length = content_size(response.headers, len(data))
                 else:
-                    result['error'] = '不是有效的M3U8文件'
+                    self.metrics.observe('body', time.time() - headers_time)
+                    result.code = ProbeError.NOT_M3U8
+            elif not (response.status == 304 and plan and self.origins.not_modified(plan, result)):
+                result.code = ProbeError.HTTP
+            result.response_time = round(time.time() - start_time, 2)
+            if plan:
+                self.origins.learn(plan, response.status, response.headers, response.url, result)
+            completed = True
+        finally:
+            if completed:
+                await response.release(self.drain_limit)
             else:
-                result['error'] = f'HTTP {response.status_code}'
-                
-        except requests.exceptions.RequestException as e:
-            result['error'] = str(e)
-        except Exception as e:
-            result['error'] = f"Unexpected error: {str(e)}"
-            
-        return result
+                response.close()
+
+    def connected_ip_version(self, url: str) -> str:
+        """URL所在主机实际连接使用的IP版本（Happy Eyeballs胜出的地址族），未知时返回空字符串"""
+        return self.resolver.ip_version(self.get_host(url))
+
+    def get_host(self, url: str) -> str:
+        """URL中的主机名，无法解析时返回空字符串"""
+        try:
+            return urlsplit(url).hostname or ''
+        except ValueError:
+            return ''
 
     def get_ip_version_from_url(self, url: str) -> str:
         """从URL中判断使用的IP版本"""
         try:
-            from urllib.parse import urlparse
-            parsed = urlparse(url)
-            hostname = parsed.hostname
-            
-            if not hostname:
-                return "Unknown"
-            
-            # 检查是否是IPv6地址（在方括号中）
-            if hostname.startswith('[') and hostname.endswith(']'):
-                return "IPv6"
-            # 检查是否是裸IPv6地址（不应该出现这种情况）
-            elif ':' in hostname and hostname.count(':') >= 2:
-                return "IPv6"
-            # 检查是否是IPv4地址
-            elif re.match(r'^\d+\.\d+\.\d+\.\d+$', hostname):
-                return "IPv4"
-            else:
-                # 域名，根据当前网络模式判断
-                return self.network_mode.upper()
-                
-        except:
+            return host_ip_version(urlsplit(url).hostname, self.network_mode)
+        except ValueError:
             return "Unknown"
 
-    def scan_id_range(self, base_url: str, start_id: int, end_id: int, batch_size=1000) -> List[Dict]:
-        """扫描ID范围"""
-        self.found_channels = []
+    def open_scan_state(self, base_url: str, resume: bool = True):
+        """打开（或从断点恢复）某个URL模式的断点记录和结果文件，返回(断点, 结果文件)"""
+        checkpoint = ScanCheckpoint(ScanCheckpoint.path_for(self.output_dir, base_url), base_url)
+        if resume and checkpoint.load() and checkpoint.sink_file:
+            self.sink_format = checkpoint.sink_format or self.sink_format
+            sink = self.open_sink(checkpoint.sink_file, append=True)
+        else:
+            checkpoint.remove()
+            sink = self.open_sink()
+        checkpoint.sink_file = os.path.basename(sink.filepath)
+        checkpoint.sink_format = self.sink_format
+        return checkpoint, sink
+
+    def scan_lease(self, base_url: str, start_id: int, end_id: int, batch_size=1000) -> List[Dict]:
+        """扫描分片工作者领到的一个租约，不写断点和结果文件，返回有效结果"""
+        found = []
+        self.rate_controller = AdaptiveRateController(self.max_workers) if self.adaptive else None
+        self.metrics = ScanMetrics()
+        self.resolver.metrics = self.metrics
+        
+        def handle_result(result: ProbeResult):
+            if result.valid:
+                found.append({key: result.get(key, '') for key in ResultSink.fields})
+                self.logger.info(f"✅ 发现频道: {result.channel_name} [{result.ip_version}] (ID: {result.id})")
+        
+        host = urlsplit(base_url).hostname or ''
+        self.logger.info(f"扫描租约: {start_id} - {end_id}")
+        self.run_engine(
+            functools.partial(self.check_single_id, base_url),
+            lambda client, id_num: self.check_single_id_async(client, base_url, id_num),
+            iter(range(start_id, end_id + 1)), handle_result, lambda id_num: host, batch_size,
+        )
+        return found
+
+    def scan_id_range_sharded(self, base_url: str, start_id: int, end_id: int, processes: int = None,
+                              lease_size: int = 2000, lease_timeout: float = 120, listen: tuple = ('127.0.0.1', 0),
+                              token: str = '', resume: bool = True) -> ResultSink:
+        """
+        分片扫描：本进程作为协调者把ID范围切成租约，分给本机的processes个工作进程，
+        以及通过 --worker 连接进来的其它机器；所有结果合并到同一个结果文件和断点中
+        :param listen: 协调服务监听地址，需要其它机器参与时使用 ('0.0.0.0', 端口)
+        """
+        import multiprocessing
+        
+        checkpoint, sink = self.open_scan_state(base_url, resume)
+        processes = processes if processes is not None else (os.cpu_count() or 2)
+        if self.scan_strategy != "exhaustive":
+            self.logger.warning("分片扫描按租约逐个扫描ID，不使用稀疏探索")
+        found_before = len(sink)
+        merge_lock = threading.Lock()
+        
+        def merge(lease_start: int, lease_end: int, results: List[Dict]):
+            with merge_lock:
+                for result in results:
+                    sink.write(result)
+                    self.logger.info(f"✅ 发现频道: {result['channel_name']} [{result['ip_version']}] (ID: {result['id']})")
+                checkpoint.mark_range_done(lease_start, lease_end)
+                checkpoint.save()
+                progress = (coordinator.done_ids + done_before) / total_ids * 100
+                self.logger.info(f"进度: {progress:.1f}% | 完成租约: {lease_start}-{lease_end} | 发现: {len(sink)}")
+        
+        total_ids = end_id - start_id + 1
+        done_before = checkpoint.completed_count(start_id, end_id)
+        coordinator = ShardCoordinator(checkpoint.pending_ranges(start_id, end_id), lease_size, lease_timeout, merge)
+        config = {field: getattr(self, field) for field in SHARD_CONFIG_FIELDS}
+        try:
+            loopback = listen[0] == 'localhost' or ipaddress.ip_address(listen[0]).is_loopback
+        except ValueError:
+            loopback = False
+        if not token and not loopback:
+            # 对外监听时没有令牌，任何人都能领取租约或提交伪造的结果
+            token = secrets.token_urlsafe(16)
+            self.logger.warning(f"协调服务监听 {listen[0] or '0.0.0.0'} 但未设置令牌，已自动生成: {token}")
+        server = ShardServer(listen, coordinator, base_url, config, token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = listen[0] if listen[0] not in ('', '0.0.0.0') else socket.gethostname()
+        url = f"http://{host}:{server.server_address[1]}"
+        
+        self.logger.info(f"开始分片扫描: {start_id} - {end_id} (共{total_ids}个ID, 待扫描 {coordinator.total_ids} 个)")
+        self.logger.info(f"租约大小: {lease_size}, 本机工作进程: {processes}, 协调服务: {url}")
+        if listen[0] != '127.0.0.1':
+            self.logger.info(f"其它机器加入: python 直播源扫描2.0(1).py --worker {url}" + (" --token ***" if token else ""))
+        
+        workers = {}
+        restarts = 0
+        
+        def start_worker(name: str):
+            worker = multiprocessing.Process(target=run_shard_worker, args=(url, name, token), daemon=True)
+            worker.start()
+            workers[name] = worker
+        
+        try:
+            for i in range(processes):
+                start_worker(f"local-{i + 1}")
+            while not coordinator.finished:
+                time.sleep(0.5)
+                for name, worker in list(workers.items()):
+                    if worker.exitcode is not None and not coordinator.finished:
+                        # 工作进程意外退出：立即收回它的租约并补一个新进程
+                        if (coordinator.release_worker(name) or worker.exitcode != 0) and restarts < processes * 3:
+                            self.logger.warning(f"工作进程 {name} 已退出 (退出码 {worker.exitcode})，重新启动")
+                            restarts += 1
+                            start_worker(name)
+            for worker in workers.values():
+                worker.join(timeout=5)
+        finally:
+            for worker in workers.values():
+                if worker.is_alive():
+                    worker.terminate()
+            server.shutdown()
+            server.server_close()
+            checkpoint.save(force=True)
+            sink.close()
+        
+        self.logger.info(f"分片扫描完成! 本次新发现 {len(sink) - found_before} 个, 共 {len(sink)} 个有效频道 (重新分配租约 {coordinator.reassigned} 次)")
+        if self.deep_probe and len(sink):
+            self.deep_probe_results(sink)
+        return sink
+
+    def scan_id_range(self, base_url: str, start_id: int, end_id: int, batch_size=1000,
+                      resume: bool = True) -> ResultSink:
+        """扫描ID范围，有效频道实时写入结果文件；resume=True时跳过断点中已完成的ID"""
+        checkpoint, sink = self.open_scan_state(base_url, resume)
+        
         total_ids = end_id - start_id + 1
+        done_before = checkpoint.completed_count(start_id, end_id)
         
         self.logger.info(f"开始扫描ID范围: {start_id} - {end_id} (共{total_ids}个ID)")
+        if done_before:
+            self.logger.info(f"从断点继续: 已完成 {done_before} 个ID, 已发现 {len(sink)} 个频道")
         self.logger.info(f"基础URL模式: {base_url}")
         self.logger.info(f"网络模式: {self.network_mode}")
-        self.logger.info(f"线程数: {self.max_workers}, 超时: {self.timeout}秒")
+        self.logger.info(f"扫描引擎: {self.engine}, 并发数: {self.max_workers}, 超时: {self.timeout}秒")
+        if self.engine == "asyncio":
+            rps = self.requests_per_second or "不限"
+            self.logger.info(f"单主机连接上限: {self.per_host_limit}, 每秒请求上限: {rps}")
+        if self.adaptive:
+            self.logger.info(f"自适应限速: 已启用 (并发上限 {self.max_workers})")
         self.logger.info(f"保存目录: {self.output_dir}")
         
         # 先测试一个URL看看格式是否正确
         test_url = self.generate_url(base_url, start_id)
         self.logger.info(f"测试URL格式: {test_url}")
         
-        # 分批扫描以避免内存问题
-        for batch_start in range(start_id, end_id + 1, batch_size):
-            batch_end = min(batch_start + batch_size - 1, end_id)
-            batch_ids = range(batch_start, batch_end + 1)
+        scanned = done_before
+        self.rate_controller = AdaptiveRateController(self.max_workers) if self.adaptive else None
+        host = urlsplit(base_url).hostname or ''
+        explorer = None
+        if self.scan_strategy == "sparse":
+            # 断点中已发现的频道作为种子，继续在它们附近加密
+            explorer = SparseExplorer(start_id, end_id, host, self.max_workers, self.rate_controller,
+                                      self.explore_stride, self.explore_min_stride, checkpoint.is_done,
+                                      (record['id'] for record in sink if start_id <= record['id'] <= end_id))
+            pending_ids = explorer
+            self.logger.info(f"扫描策略: 稀疏探索 (步长 {explorer.stride}, 最小步长 {explorer.min_stride})")
+        else:
+            pending_ids = itertools.chain.from_iterable(checkpoint.pending_ranges(start_id, end_id))
+        self.metrics = ScanMetrics(self.metrics_file)
+        self.resolver.metrics = self.metrics
+        self.profiler = ScanProfiler() if self.profile_file else None
+        
+        def handle_result(result: ProbeResult):
+            nonlocal scanned
+            scanned += 1
+            id_num = result.id
+            if result.valid:
+                sink.write(result)
+                ip_info = f"[{result.ip_version}]"
+                self.logger.info(f"✅ 发现频道: {result.channel_name} {ip_info} (ID: {id_num}, 响应: {result.response_time}s)")
+            elif scanned % 50 == 0:
+                # 只在调试时显示错误
+                self.logger.debug(f"ID {id_num} 无效: {result.error}")
+            if explorer is not None:
+                explorer.observe(id_num, result.valid)
+            checkpoint.mark_done(id_num)
+            checkpoint.save()
+            self.metrics.record(result)
+            self.metrics.export()
+            for listener in self.result_listeners:
+                listener(result)
+            
+            # 显示进度
+            if scanned % 100 == 0 or scanned == total_ids:
+                progress = scanned / total_ids * 100
+                self.logger.info(f"进度: {progress:.1f}% | 已扫描: {scanned}/{total_ids} | 发现: {len(sink)} | 速度: {self.metrics.throughput():.1f}/s")
+        
+        try:
+            self.run_engine(
+                functools.partial(self.check_single_id, base_url),
+                lambda client, id_num: self.check_single_id_async(client, base_url, id_num),
+                pending_ids, handle_result, lambda id_num: host, batch_size,
+            )
+        finally:
+            checkpoint.save(force=True)
+            sink.close()
+            self.metrics.export(force=True)
+            if self.profiler:
+                self.save_profile()
+            if self.probe_cache:
+                self.probe_cache.evict()
+        
+        self.logger.info(f"扫描完成! 共找到 {len(sink)} 个有效频道")
+        if explorer is not None:
+            report = explorer.report()
+            self.logger.info(f"稀疏探索: 探测 {report['probed']}/{total_ids} 个ID (覆盖率 {report['coverage']:.1%}), "
+                             f"{report['clusters']} 个簇, 最终步长 {report['stride']}, "
+                             f"估计有效ID约 {report['estimated_total']} 个 (估计发现率 {report['confidence']:.0%}, "
+                             f"比步长{report['stride']}窄的簇可能未被发现，实际发现率可能更低)")
+        self.log_metrics_summary()
+        if self.deep_probe and len(sink):
+            self.deep_probe_results(sink)
+        if self.rate_controller:
+            for host, state in self.rate_controller.summary().items():
+                self.logger.info(f"自适应限速 {host}: 最终并发 {state['limit']}, 退避 {state['backoff']}s, 基准延迟 {state['baseline']}s")
+        return sink
+
+    def run_jobs(self, jobs: List["BatchJob"], resume: bool = True, batch_size=1000) -> List[Dict]:
+        """
+        在同一个引擎、连接池和按主机调度器中同时运行多个扫描任务，每个任务各自的断点、结果文件和最终列表
+        保存在self.output_dir中；同一主机的多个任务共享该主机的并发上限（取各任务设置中的较小值）
+        任务的network_mode只作用于该任务的主机（同一主机以第一个任务的设置为准）
+        :return: 每个任务的汇总信息，同时写入 批量任务汇总.json
+        """
+        self.rate_controller = AdaptiveRateController(self.max_workers) if self.adaptive else None
+        self.metrics = ScanMetrics(self.metrics_file)
+        self.resolver.metrics = self.metrics
+        self.profiler = ScanProfiler() if self.profile_file else None
+        scheduler = HostScheduler((), lambda target: jobs[target[0]].host, self.per_host_limit, self.rate_controller)
+        pinned = {}
+        
+        for index, job in enumerate(jobs):
+            job.checkpoint = ScanCheckpoint(ScanCheckpoint.path_for(self.output_dir, job.base_url), job.base_url)
+            resumed = resume and job.checkpoint.load() and job.checkpoint.sink_file
+            if resumed and job.checkpoint.completed_count(job.start, job.end) >= job.total:
+                # 上次已经扫完（例如中断在保存列表时），断点只用于恢复未完成的扫描
+                self.logger.info(f"任务 {job.name}: 上次已全部完成，重新扫描")
+                resumed = False
+            if resumed:
+                sink_cls = RESULT_SINKS.get(job.checkpoint.sink_format, JsonlResultSink)
+                job.sink = sink_cls(os.path.join(self.output_dir, job.checkpoint.sink_file)).open(append=True)
+            else:
+                job.checkpoint.remove()
+                sink_cls = RESULT_SINKS.get(self.sink_format, JsonlResultSink)
+                filename = f"{INVALID_NAME_CHARS.sub('_', job.name)}_扫描结果{sink_cls.extension}"
+                job.sink = sink_cls(os.path.join(self.output_dir, filename)).open()
+            job.checkpoint.sink_file = os.path.basename(job.sink.filepath)
+            job.checkpoint.sink_format = next(fmt for fmt, cls in RESULT_SINKS.items() if cls is sink_cls)
+            job.scanned = job.checkpoint.completed_count(job.start, job.end)
+            
+            if job.network_mode and job.host:
+                if pinned.setdefault(job.host, job.network_mode) != job.network_mode:
+                    self.logger.warning(f"任务 {job.name}: 主机 {job.host} 已按 {pinned[job.host]} 模式连接，忽略 {job.network_mode}")
+                else:
+                    self.resolver.pin(job.host, job.network_mode)
+            ids = itertools.chain.from_iterable(job.checkpoint.pending_ranges(job.start, job.end))
+            scheduler.add(job.host, zip(itertools.repeat(index), ids), job.total - job.scanned, job.per_host_limit)
+            self.logger.info(f"任务 {job.name}: {job.base_url} [{job.start}-{job.end}] 待扫描 {job.total - job.scanned} 个"
+                             + (f", 已发现 {len(job.sink)} 个" if len(job.sink) else ""))
+        
+        total_ids = len(scheduler)
+        scanned = 0
+        self.logger.info(f"批量扫描: {len(jobs)} 个任务, 共 {total_ids} 个ID, 涉及 {len(scheduler.inflight)} 个主机")
+        self.logger.info(f"扫描引擎: {self.engine}, 并发数: {self.max_workers}, 单主机上限: {self.per_host_limit}, 超时: {self.timeout}秒")
+        
+        def check(target):
+            result = self.check_single_id(jobs[target[0]].base_url, target[1])
+            result.job = target[0]
+            return result
+        
+        async def check_async(client, target):
+            result = await self.check_single_id_async(client, jobs[target[0]].base_url, target[1])
+            result.job = target[0]
+            return result
+        
+        def handle_result(result: ProbeResult):
+            nonlocal scanned
+            scanned += 1
+            job = jobs[result.job]
+            job.scanned += 1
+            if result.valid:
+                job.sink.write(result)
+                self.logger.info(f"✅ [{job.name}] 发现频道: {result.channel_name} [{result.ip_version}] (ID: {result.id})")
+            job.checkpoint.mark_done(result.id)
+            job.checkpoint.save()
+            self.metrics.record(result)
+            self.metrics.export()
+            for listener in self.result_listeners:
+                listener(result)
+            if scanned % 500 == 0 or scanned == total_ids:
+                progress = " | ".join(f"{job.name} {job.scanned}/{job.total} 发现{len(job.sink)}" for job in jobs)
+                self.logger.info(f"进度: {scanned}/{total_ids} | 速度: {self.metrics.throughput():.1f}/s | {progress}")
+        
+        try:
+            self.run_engine(check, check_async, scheduler, handle_result, lambda target: jobs[target[0]].host,
+                            batch_size, hosts=len(scheduler.inflight))
+        finally:
+            for job in jobs:
+                job.checkpoint.save(force=True)
+                job.sink.close()
+            self.metrics.export(force=True)
+            if self.profiler:
+                self.save_profile()
+            if self.probe_cache:
+                self.probe_cache.evict()
+        
+        self.log_metrics_summary()
+        summary = []
+        for job in jobs:
+            if self.deep_probe and len(job.sink):
+                self.deep_probe_results(job.sink)
+            self.sink = job.sink
+            playlist, _ = self.save_results(job.output)
+            summary.append({
+                'name': job.name, 'base_url': job.base_url, 'start': job.start, 'end': job.end,
+                'scanned': job.scanned, 'found': len(job.sink), 'result_file': job.sink.filepath,
+                'playlist': playlist or '',
+            })
+            self.logger.info(f"任务 {job.name} 完成: 扫描 {job.scanned}/{job.total}, 有效 {len(job.sink)} 个")
+            if job.scanned >= job.total:
+                # 整个区间都已扫完，下次运行（例如定时任务）重新扫描
+                job.checkpoint.remove()
+        summary_file = os.path.join(self.output_dir, "批量任务汇总.json")
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump({'finished': time.strftime('%Y-%m-%d %H:%M:%S'), 'jobs': summary}, f, ensure_ascii=False, indent=2)
+        self.logger.info(f"批量任务汇总: {summary_file}")
+        return summary
+
+    def fetch_playlist(self, url: str):
+        """下载播放列表文本（最多max_playlist_bytes字节），返回(跟随重定向后的URL, 文本)"""
+        response = self.session.get(url, timeout=self.timeout, stream=True)
+        try:
+            if response.status_code != 200:
+                raise requests.exceptions.HTTPError(f'HTTP {response.status_code}')
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=16384):
+                data += chunk
+                if len(data) >= self.max_playlist_bytes:
+                    break
+            return response.url, data.decode(response.encoding or 'utf-8', errors='replace')
+        finally:
+            response.close()
+
+    def measure_download(self, url: str):
+        """
+        在字节和时间预算内下载分片，计时从收到响应头开始，不包含建立连接和等待首字节的时间
+        :return: (下载字节数, 耗时秒数, Content-Length)
+        """
+        start_time = time.time()
+        response = self.session.get(url, timeout=self.timeout, stream=True)
+        try:
+            if response.status_code != 200:
+                raise requests.exceptions.HTTPError(f'分片 HTTP {response.status_code}')
+            body_start = time.time()
+            received = 0
+            for chunk in response.iter_content(chunk_size=16384):
+                received += len(chunk)
+                if received >= self.deep_probe_bytes or time.time() - start_time >= self.deep_probe_seconds:
+                    break
+            length = response.headers.get('content-length', '')
+            return received, max(time.time() - body_start, 1e-3), int(length) if length.isdigit() else 0
+        finally:
+            response.close()
+
+    def deep_probe_stream(self, url: str) -> Dict:
+        """
+        深度检测：主播放列表有#EXT-X-STREAM-INF时选码率最高的子播放列表，
+        下载其中第一个分片的一部分，测量实际下载速度（bps），并与标称码率比较
+        没有标称码率时，用分片大小除以#EXTINF时长估算
+        """
+        info = {'bandwidth': 0, 'throughput': 0, 'deep_error': ''}
+        try:
+            playlist_url, text = self.fetch_playlist(url)
+            variants = []
+            for attributes, uri in STREAM_INF_PATTERN.findall(text):
+                match = BANDWIDTH_PATTERN.search(attributes)
+                variants.append((int(match.group(1)) if match else 0, uri.strip()))
+            if variants:
+                info['bandwidth'], uri = max(variants, key=lambda variant: variant[0])
+                playlist_url, text = self.fetch_playlist(urljoin(playlist_url, uri))
+            
+            segment = SEGMENT_PATTERN.search(text)
+            if not segment:
+                info['deep_error'] = '没有找到媒体分片'
+                return info
+            received, elapsed, length = self.measure_download(urljoin(playlist_url, segment.group(2).strip()))
+            info['throughput'] = int(received * 8 / elapsed)
+            duration = float(segment.group(1) or 0)
+            if not info['bandwidth'] and length and duration:
+                info['bandwidth'] = int(length * 8 / duration)
+        except requests.exceptions.RequestException as e:
+            info['deep_error'] = str(e)
+        except Exception as e:
+            info['deep_error'] = f"Unexpected error: {str(e)}"
+        return info
+
+    def deep_probe_results(self, sink: ResultSink):
+        """对结果文件中的有效频道进行深度检测，把标称码率和实测速度写回结果文件"""
+        channels = [(record['url'], record['channel_name']) for record in sink]
+        self.logger.info(f"开始深度检测: {len(channels)} 个频道 (每个分片最多 {self.deep_probe_bytes // 1024}KB / {self.deep_probe_seconds}秒)")
+        measured = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.deep_probe_workers) as executor:
+            future_to_channel = {executor.submit(self.deep_probe_stream, url): (url, name) for url, name in channels}
+            for future in concurrent.futures.as_completed(future_to_channel):
+                url, name = future_to_channel[future]
+                info = measured[url] = future.result()
+                if info['deep_error']:
+                    self.logger.info(f"⚠️ 深度检测失败: {name} ({info['deep_error']})")
+                    continue
+                advertised = f"{info['bandwidth'] / 1e6:.2f}Mbps" if info['bandwidth'] else "未知"
+                self.logger.info(f"📶 {name}: 实测 {info['throughput'] / 1e6:.2f}Mbps / 标称 {advertised}")
+        
+        def updated():
+            for record in sink:
+                info = measured.get(record['url'])
+                if info:
+                    record['bandwidth'] = info['bandwidth']
+                    record['throughput'] = info['throughput']
+                yield record
+        sink.rewrite(updated())
+        smooth = sum(1 for info in measured.values()
+                     if info['throughput'] and info['throughput'] >= info['bandwidth'])
+        self.logger.info(f"深度检测完成: {smooth}/{len(channels)} 个频道实测速度不低于标称码率")
+
+    def merge_playlists(self, filepaths: List[str], output_file: str) -> Dict:
+        """
+        合并多个直播源列表：按规范化URL（见normalize_url）去重，重复地址只保留一条，
+        名称取第一个有意义的名称（不是 "频道N" 这类序号名），分组和UA取第一个非空值
+        输出按分组首次出现的顺序排列，格式由输出文件扩展名决定（.m3u / .m3u8 为M3U，其它为txt）
+        :return: 合并统计
+        """
+        merged = {}  # 规范化URL -> PlaylistEntry，按首次出现顺序
+        total = 0
+        header = ''
+        for filepath in filepaths:
+            reader = PlaylistReader(filepath)
+            header = header or reader.header
+            before = total
+            for entry in reader:
+                total += 1
+                key = normalize_url(entry.url, self.keep_params)
+                best = merged.get(key)
+                if best is None:
+                    merged[key] = entry
+                    continue
+                if (not best.name or GENERIC_NAME_PATTERN.match(best.name)) and entry.name \
+                        and not GENERIC_NAME_PATTERN.match(entry.name):
+                    best.name = entry.name
+                    best.extinf = entry.extinf or best.extinf
+                if not best.group and entry.group:
+                    best.group = entry.group
+                if not best.user_agent and entry.user_agent:
+                    best.user_agent = entry.user_agent
+            self.logger.info(f"读取列表: {filepath} ({total - before} 个条目)")
+        
+        groups = {}
+        for entry in merged.values():
+            groups.setdefault(entry.group, []).append(entry)
+        fmt = 'm3u' if output_file.lower().endswith(('.m3u', '.m3u8')) else 'txt'
+        with PlaylistWriter(output_file, fmt, header) as playlist:
+            for entries in groups.values():
+                for entry in entries:
+                    if fmt == 'm3u' or not entry.extinf:
+                        playlist.write(entry)
+                    else:
+                        # M3U条目写成txt时不需要原#EXTINF行和指令行
+                        playlist.write(PlaylistEntry(entry.name, entry.url, entry.group, entry.user_agent))
+        
+        duplicates = total - len(merged)
+        rate = duplicates / total * 100 if total else 0
+        self.logger.info(f"✅ 合并完成: {total} 个条目 -> {len(merged)} 个不同地址 (去掉重复 {duplicates} 个, {rate:.1f}%)")
+        self.logger.info(f"合并列表已保存到: {output_file}")
+        return {
+            'files': len(filepaths),
+            'entries': total,
+            'unique': len(merged),
+            'duplicates': duplicates,
+            'groups': len(groups),
+            'output_file': output_file,
+        }
+
+    def validate_playlists(self, filepaths: List[str], output_dir: str = None) -> List[Dict]:
+        """
+        批量检测已有的直播源列表（"名称,URL" 或 #EXTM3U 格式），使用与ID扫描相同的并发探测引擎
+        每个文件生成保留原分组、UA和顺序的 "原文件名_有效" 列表，以及带响应时间的 "原文件名_检测报告.csv"
+        :param output_dir: 输出目录，默认与原文件相同
+        :return: 每个文件的统计信息
+        """
+        summaries = []
+        for filepath in filepaths:
+            reader = PlaylistReader(filepath)
+            # 第一遍只收集不同的地址（按规范化URL去重，重复地址只探测一次）
+            probes = {}
+            entry_count = 0
+            for entry in reader:
+                probes.setdefault(normalize_url(entry.url, self.keep_params), entry)
+                entry_count += 1
+            keys = list(probes)
+            self.logger.info(f"检测列表: {filepath} ({reader.format.upper()}格式, {entry_count} 个条目, {len(keys)} 个不同地址)")
+            if not keys:
+                self.logger.warning(f"列表中没有可检测的地址: {filepath}")
+                continue
+            
+            results = {}
+            total = len(keys)
+            self.rate_controller = AdaptiveRateController(self.max_workers) if self.adaptive else None
+            self.metrics = ScanMetrics(self.metrics_file)
+            self.resolver.metrics = self.metrics
+            self.profiler = ScanProfiler() if self.profile_file else None
             
-            self.logger.info(f"扫描批次: {batch_start} - {batch_end}")
+            def handle_result(result: ProbeResult):
+                results[keys[result.id]] = result
+                self.metrics.record(result)
+                self.metrics.export()
+                for listener in self.result_listeners:
+                    listener(result)
+                if len(results) % 100 == 0 or len(results) == total:
+                    alive = sum(1 for r in results.values() if r.valid)
+                    self.logger.info(f"进度: {len(results) / total * 100:.1f}% | 已检测: {len(results)}/{total} | 有效: {alive} | 速度: {self.metrics.throughput():.1f}/s")
+            
+            try:
+                self.probe_entries([probes[key] for key in keys], handle_result)
+            finally:
+                self.metrics.export(force=True)
+                if self.profiler:
+                    self.save_profile()
+                if self.probe_cache:
+                    self.probe_cache.evict()
+            
+            directory = output_dir or os.path.dirname(os.path.abspath(filepath))
+            stem, ext = os.path.splitext(os.path.basename(filepath))
+            valid_path = os.path.join(directory, f"{stem}_有效{ext}")
+            report_path = os.path.join(directory, f"{stem}_检测报告.csv")
+            
+            # 第二遍按原顺序写出有效条目和检测报告
+            with PlaylistWriter(valid_path, reader.format, reader.header) as playlist, \
+                    open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'group', 'name', 'url', 'valid', 'status', 'response_time', 'ip_version', 'error'])
+                for entry in reader:
+                    result = results.get(normalize_url(entry.url, self.keep_params), {})
+                    if result.get('valid'):
+                        playlist.write(entry)
+                    writer.writerow([entry.line_no, entry.group, entry.name, entry.url, result.get('valid', False),
+                                     result.get('status', ''), result.get('response_time', ''),
+                                     result.get('ip_version', ''), result.get('error', '')])
+            kept = playlist.count
+            
+            self.logger.info(f"✅ {filepath}: 保留 {kept}/{entry_count} 个条目")
+            self.logger.info(f"有效列表已保存到: {valid_path}")
+            self.logger.info(f"检测报告已保存到: {report_path}")
+            self.log_metrics_summary()
+            summaries.append({
+                'file': filepath,
+                'entries': entry_count,
+                'urls': total,
+                'kept': kept,
+                'valid_file': valid_path,
+                'report_file': report_path,
+            })
+        return summaries
+
+    def probe_entries(self, entries: List[PlaylistEntry], on_result):
+        """检测一组列表条目（使用条目指定的UA），结果的id为条目在entries中的序号"""
+        hosts = {index: self.get_host(entry.url) for index, entry in enumerate(entries)}
+        # 按主机轮询，单一主机占多数的列表也不会让其它主机空闲
+        scheduler = HostScheduler(range(len(entries)), hosts.get, self.per_host_limit, self.rate_controller)
+        self.logger.info(f"涉及 {len(scheduler.queues)} 个主机, 单主机并发上限 {self.per_host_limit}, 总并发 {self.max_workers}")
+        self.run_engine(
+            lambda index: self.check_url(entries[index].url, index, entries[index].user_agent),
+            lambda client, index: self.check_url_async(client, entries[index].url, index,
+                                                       entries[index].user_agent),
+            scheduler, on_result, hosts.get,
+            hosts=len(scheduler.queues),
+        )
+
+    def monitor_playlist(self, filepath: str, output_dir: str = None, interval: float = 60, cycles: int = 0,
+                         min_interval: float = 300, max_interval: float = 86400):
+        """
+        健康监控（常驻运行）：按MonitorState的优先级计划只复查到期的地址，状态在两轮之间和重启后保留
+        每轮把上线、下线和变化的条目追加到 "原文件名_变更.jsonl"，有变化时重新生成只含在线条目的
+        "原文件名_在线" 列表（保留原分组、UA和顺序）；列表文件修改后自动同步新增和删除的条目
+        :param interval: 两轮之间最长等待秒数（也是检查列表文件是否修改的周期）
+        :param cycles: 运行轮数，0为一直运行（Ctrl+C退出）
+        """
+        directory = output_dir or os.path.dirname(os.path.abspath(filepath))
+        stem, ext = os.path.splitext(os.path.basename(filepath))
+        state = MonitorState(os.path.join(directory, f".{stem}_监控状态.json"), min_interval, max_interval)
+        changes_path = os.path.join(directory, f"{stem}_变更.jsonl")
+        online_path = os.path.join(directory, f"{stem}_在线{ext}")
+        if state.load():
+            self.logger.info(f"读取监控状态: {len(state.entries)} 个地址")
+        
+        self.rate_controller = AdaptiveRateController(self.max_workers) if self.adaptive else None
+        self.metrics = ScanMetrics(self.metrics_file)
+        self.resolver.metrics = self.metrics
+        source_mtime = None
+        reader = None
+        entries = {}
+        render = not os.path.exists(online_path)
+        cycle = 0
+        try:
+            while True:
+                cycle += 1
+                changes = []
+                now = time.time()
+                mtime = os.path.getmtime(filepath)
+                if mtime != source_mtime:
+                    reader = PlaylistReader(filepath)
+                    entries = {}
+                    for entry in reader:
+                        entries.setdefault(normalize_url(entry.url, self.keep_params), entry)
+                    for removed in state.sync({key: entry.url for key, entry in entries.items()}):
+                        changes.append({'change': 'removed', 'url': removed['url'], 'reason': '已从列表删除'})
+                    if source_mtime is not None:
+                        self.logger.info(f"列表文件已修改，重新读取: {len(entries)} 个地址")
+                    source_mtime = mtime
+                    render = render or bool(changes)
+                
+                keys = state.due(now)
+                if keys:
+                    targets = [entries[key] for key in keys]
+                    
+                    def handle_result(result: ProbeResult):
+                        entry = targets[result.id]
+                        change = state.update(keys[result.id], result, time.time())
+                        self.metrics.record(result)
+                        if change:
+                            changes.append({'change': change, 'url': entry.url, 'name': entry.name,
+                                            'group': entry.group, 'status': result.status, 'error': result.error,
+                                            'response_time': result.response_time, 'ip_version': result.ip_version})
+                    
+                    self.probe_entries(targets, handle_result)
+                    self.metrics.export()
+                    if self.probe_cache:
+                        self.probe_cache.evict()
+                
+                if changes:
+                    stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+                    with open(changes_path, 'a', encoding='utf-8') as f:
+                        for change in changes:
+                            f.write(json.dumps({'time': stamp, **change}, ensure_ascii=False) + '\n')
+                    for change in changes:
+                        icon = {'added': '🟢', 'removed': '🔴', 'changed': '🟡'}[change['change']]
+                        self.logger.info(f"{icon} {change['change']}: {change.get('name', '')} {change['url']}")
+                if changes or render:
+                    with PlaylistWriter(online_path, reader.format, reader.header) as playlist:
+                        for entry in reader:
+                            if state.entries.get(normalize_url(entry.url, self.keep_params), {}).get('alive'):
+                                playlist.write(entry)
+                    render = False
+                state.save()
+                
+                alive = sum(1 for entry in state.entries.values() if entry['alive'])
+                wait = max(1.0, min(interval, state.next_due() - time.time()))
+                self.logger.info(f"第 {cycle} 轮: 检测 {len(keys)}/{len(state.entries)} 个地址, 变化 {len(changes)} 个, "
+                                 f"在线 {alive} 个, {wait:.0f}秒后继续")
+                if cycles and cycle >= cycles:
+                    break
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            self.logger.info("监控已停止")
+            state.save()
+        finally:
+            self.metrics.export(force=True)
+        return state
+
+    def run_engine(self, check, check_async, targets: Iterator, on_result, host_of, batch_size=1000,
+                   hosts: int = 1):
+        """
+        按self.engine选择引擎执行探测，设置了profile_file时在cProfile下运行
+        :param check: check(目标) -> 结果，线程池引擎使用
+        :param check_async: check_async(client, 目标) -> 结果协程，asyncio引擎使用
+        :param targets: 目标的迭代器，或按主机轮询的HostScheduler
+        :param host_of: host_of(目标) -> 主机名，用于自适应限速
+        :param hosts: 涉及的主机数量，用于设置连接池
+        """
+        if self.engine == "asyncio":
+            engine_args = (self.run_async_engine, check_async, targets, on_result, host_of)
+        else:
+            engine_args = (self.run_thread_engine, check, targets, on_result, host_of, batch_size, hosts)
+        if self.profiler:
+            self.profiler.call(*engine_args)
+        else:
+            engine_args[0](*engine_args[1:])
+
+    def run_thread_engine(self, check, targets: Iterator, on_result, host_of, batch_size=1000,
+                          hosts: int = 1):
+        """线程池引擎：分批提交，每批结束后短暂暂停"""
+        self.configure_connection_pool(hosts)
+        counters_before = self.pool_counters()
+        try:
+            if isinstance(targets, HostScheduler):
+                self._run_thread_scheduled(check, targets, on_result)
+            else:
+                self._run_thread_batches(check, targets, on_result, host_of, batch_size)
+        finally:
+            counters = self.pool_counters()
+            new = counters['new'] - counters_before['new']
+            requests_total = counters['requests'] - counters_before['requests']
+            self.record_connection_stats(new, max(0, requests_total - new))
+
+    def record_connection_stats(self, new: int, reused: int):
+        """记录并输出本次扫描的连接复用情况"""
+        self.connection_stats = {'new': new, 'reused': reused}
+        total = new + reused
+        rate = reused / total * 100 if total else 0
+        self.logger.info(f"连接统计: 新建 {new} 个, 复用 {reused} 次 (复用率 {rate:.1f}%)")
+
+    def _run_thread_batches(self, check, ids: Iterator, on_result, host_of, batch_size: int):
+        batch_ids = list(itertools.islice(ids, batch_size))
+        
+        # 分批扫描以避免内存问题
+        while batch_ids:
+            self.logger.info(f"扫描批次: {batch_ids[0]} - {batch_ids[-1]}")
             
             with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
                 # 提交任务
                 future_to_id = {
-                    executor.submit(self.check_single_id, base_url, id_num): id_num 
+                    executor.submit(self.controlled_check, check, id_num, host_of): id_num 
                     for id_num in batch_ids
                 }
                 
-                completed = 0
-                batch_found = 0
-                
                 for future in concurrent.futures.as_completed(future_to_id):
                     id_num = future_to_id[future]
-                    completed += 1
-                    
                     try:
-                        result = future.result()
-                        if result['valid']:
-                            self.found_channels.append(result)
-                            batch_found += 1
-                            ip_info = f"[{result['ip_version']}]"
-                            self.logger.info(f"✅ 发现频道: {result['channel_name']} {ip_info} (ID: {id_num}, 响应: {result['response_time']}s)")
-                        else:
-                            # 只在调试时显示错误
-                            if completed % 50 == 0:
-                                self.logger.debug(f"ID {id_num} 无效: {result['error']}")
-                        
-                        # 显示进度
-                        if completed % 100 == 0 or completed == len(batch_ids):
-                            progress = (batch_start - start_id + completed) / total_ids * 100
-                            self.logger.info(f"进度: {progress:.1f}% | 已扫描: {batch_start - start_id + completed}/{total_ids} | 发现: {len(self.found_channels)}")
-                            
+                        on_result(future.result())
                     except Exception as e:
                         self.logger.error(f"❌ 检查ID {id_num} 失败: {str(e)}")
             
+            batch_ids = list(itertools.islice(ids, batch_size))
+            
             # 批次间短暂暂停
-            if batch_end < end_id:
+            if batch_ids:
                 time.sleep(1)
+
+    def _run_thread_scheduled(self, check, scheduler: HostScheduler, on_result):
+        """由主线程按HostScheduler轮询派发任务，工作线程完成后立即补充下一个，结果在主线程处理"""
+        completed = queue.Queue()
+        
+        def run(target):
+            try:
+                completed.put((target, self.controlled_check(check, target, scheduler.host_of), None))
+            except Exception as e:
+                completed.put((target, None, e))
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while scheduler.running < self.max_workers:
+                    target = scheduler.next()
+                    if target is None:
+                        break
+                    executor.submit(run, target)
+                if not scheduler.running:
+                    break
+                target, result, error = completed.get()
+                scheduler.done(target)
+                if error:
+                    self.logger.error(f"❌ 检查 {target} 失败: {str(error)}")
+                    continue
+                try:
+                    on_result(result)
+                except Exception as e:
+                    self.logger.error(f"❌ 处理 {target} 的结果失败: {str(e)}")
+
+    def log_metrics_summary(self):
+        """输出各阶段耗时和结果类别统计"""
+        snapshot = self.metrics.snapshot()
+        for phase, stats in snapshot['phases'].items():
+            self.logger.info(f"阶段耗时 {phase:<7}: p50 ≤{stats['p50']}s, p90 ≤{stats['p90']}s, p99 ≤{stats['p99']}s ({stats['count']}次)")
+        errors = ', '.join(f"{kind} {count}" for kind, count in
+                           sorted(snapshot['errors'].items(), key=lambda item: -item[1]))
+        self.logger.info(f"结果分类: {errors}")
+        self.logger.info(f"平均速度: {snapshot['average_probes_per_sec']}/s")
+        resolver = self.resolver
+        if resolver.hits or resolver.misses:
+            self.logger.info(f"DNS缓存: 命中 {resolver.hits} 次, 实际解析 {resolver.misses} 次")
+        if self.probe_cache:
+            self.logger.info(f"缓存命中: {self.probe_cache.hits} 次, 实际请求: {self.probe_cache.misses} 次")
+        if self.origin_probing:
+            counters = self.origins.summary()['counters']
+            if any(counters.values()):
+                self.logger.info(f"请求方式: HEAD {counters['head']} 次 (直接判定无效 {counters['head_rejected']} 次), "
+                                 f"Range响应 {counters['ranged']} 次, 304未变化 {counters['not_modified']} 次, "
+                                 f"直接请求跳转目标 {counters['redirect_cached']} 次, 回退普通请求 {counters['fallback']} 次")
+        if self.metrics_file:
+            self.logger.info(f"扫描指标已保存到: {self.metrics_file}")
+
+    def save_profile(self):
+        """保存cProfile统计并打印累计耗时最多的函数"""
+        stats = self.profiler.dump(self.profile_file)
+        if stats:
+            self.logger.info(f"性能分析已保存到: {self.profile_file} (可用 python -m pstats 查看)")
+            stats.sort_stats('cumulative').print_stats(15)
+
+    def controlled_check(self, check, target, host_of) -> ProbeResult:
+        """启用自适应限速时，在控制器分配的并发额度内执行check(target)"""
+        if self.profiler:
+            return self.profiler.call(self._controlled_check, check, target, host_of)
+        return self._controlled_check(check, target, host_of)
+
+    def _controlled_check(self, check, target, host_of) -> ProbeResult:
+        controller = self.rate_controller
+        if not controller:
+            return check(target)
+        host = host_of(target)
+        controller.acquire(host)
+        result = ProbeResult()
+        try:
+            result = check(target)
+            return result
+        finally:
+            controller.release(host, result)
+
+    def run_async_engine(self, check_async, ids: Iterator, on_result, host_of):
+        """asyncio引擎：固定数量的协程从有界队列中取ID，没有批次间的空闲"""
+        asyncio.run(self._async_scan(check_async, ids, on_result, host_of))
+
+    async def _async_scan(self, check_async, ids: Iterator, on_result, host_of):
+        headers = dict(self.session.headers)
+        headers['Accept-Encoding'] = 'identity'
+        client = AsyncHTTPClient(self.timeout, self.per_host_limit, self.requests_per_second,
+                                 self.resolver, headers, metrics=self.metrics)
+        pending = asyncio.Queue(maxsize=self.max_workers * 2)
+        
+        async def producer():
+            for id_num in ids:
+                await pending.put(id_num)
+            for _ in range(self.max_workers):
+                await pending.put(None)
         
-        self.logger.info(f"扫描完成! 共找到 {len(self.found_channels)} 个有效频道")
-        return self.found_channels
+        controller = self.rate_controller
+        
+        async def worker():
+            while True:
+                id_num = await pending.get()
+                if id_num is None:
+                    break
+                if controller:
+                    host = host_of(id_num)
+                    await controller.acquire_async(host)
+                result = ProbeResult()
+                try:
+                    result = await check_async(client, id_num)
+                    on_result(result)
+                except Exception as e:
+                    self.logger.error(f"❌ 检查ID {id_num} 失败: {str(e)}")
+                finally:
+                    if controller:
+                        controller.release(host, result)
+        
+        async def scheduled_worker():
+            # 按HostScheduler轮询取目标；所有主机都已达到上限时等待有目标完成
+            while True:
+                target = scheduler.next()
+                if target is None:
+                    if not scheduler.pending:
+                        break
+                    released.clear()
+                    await released.wait()
+                    continue
+                host = host_of(target)
+                if controller:
+                    await controller.acquire_async(host)
+                result = ProbeResult()
+                try:
+                    result = await check_async(client, target)
+                    on_result(result)
+                except Exception as e:
+                    self.logger.error(f"❌ 检查 {target} 失败: {str(e)}")
+                finally:
+                    if controller:
+                        controller.release(host, result)
+                    scheduler.done(target)
+                    released.set()
+        
+        try:
+            if isinstance(ids, HostScheduler):
+                scheduler = ids
+                released = asyncio.Event()
+                await asyncio.gather(*(scheduled_worker() for _ in range(self.max_workers)))
+            else:
+                await asyncio.gather(producer(), *(worker() for _ in range(self.max_workers)))
+        finally:
+            client.close()
+            self.record_connection_stats(client.new_connections, client.reused_connections)
+
+    def channel_groups(self) -> List[List[Dict]]:
+        """有效结果按内容指纹分组（merge_duplicates关闭时每个地址单独一组）"""
+        if not self.merge_duplicates:
+            return [[record] for record in self.sink]
+        return group_streams(self.sink, self.fingerprint_window)
 
     def save_results(self, custom_filename: str = None):
-        """保存扫描结果到指定目录，只保留有效地址"""
-        if not self.found_channels:
+        """
+        将增量结果文件渲染为最终的直播源列表，只保留有效地址
+        内容相同的地址合并为一个频道（最快的为主地址，其余在详细列表中作为备用地址）；
+        只排序一次：按IP版本分组，组内最快的在前，再由ResultExporter一遍写出export_formats中的全部格式
+        """
+        if not self.sink or not len(self.sink):
             self.logger.warning("没有找到任何有效频道，跳过保存")
             print("⚠️ 没有找到有效频道，没有生成文件")
             return None, None
@@ -476,69 +4221,49 @@ class IDRangeScanner:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             filename = f"有效直播源_{timestamp}.txt"
         
-        filepath = os.path.join(self.output_dir, filename)
-        
         try:
-            # 只保存有效的直播源，格式：频道名称,URL
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write("# 有效直播源列表\n")
-                f.write(f"# 扫描时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# 网络模式: {self.network_mode}\n")
-                f.write(f"# 总计: {len(self.found_channels)} 个有效频道\n")
-                f.write(f"# 保存路径: {filepath}\n\n")
-                
-                # 按频道名称排序
-                sorted_channels = sorted(self.found_channels, key=lambda x: x['channel_name'])
-                
-                # 使用序号作为频道名称
-                for i, channel in enumerate(sorted_channels, 1):
-                    # 格式：频道1,http://example.com/url.m3u8
-                    f.write(f"频道{i},{channel['url']}\n")
-            
-            self.logger.info(f"有效直播源已保存到: {filepath}")
-            
-            # 同时生成一个带响应时间和IP版本的详细版本
-            detail_filename = f"详细_{filename}"
-            detail_filepath = os.path.join(self.output_dir, detail_filename)
-            
-            with open(detail_filepath, 'w', encoding='utf-8') as f:
-                f.write("# 有效直播源详细列表\n")
-                f.write(f"# 扫描时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# 网络模式: {self.network_mode}\n")
-                f.write(f"# 总计: {len(self.found_channels)} 个有效频道\n\n")
-                
-                # 按响应时间排序
-                sorted_by_speed = sorted(self.found_channels, key=lambda x: x['response_time'])
-                
-                for i, channel in enumerate(sorted_by_speed, 1):
-                    f.write(f"# 频道{i} - {channel['channel_name']}\n")
-                    f.write(f"# 响应时间: {channel['response_time']}s | IP版本: {channel['ip_version']} | ID: {channel['id']}\n")
-                    f.write(f"频道{i},{channel['url']}\n\n")
+            groups = self.channel_groups()
+            duplicates = len(self.sink) - len(groups)
+            # 有深度检测结果时按实测下载速度排序，否则按响应时间排序
+            groups.sort(key=lambda group: (group[0]['ip_version'], stream_speed_key(group[0])))
+            
+            comments = [
+                f"扫描时间: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+                f"网络模式: {self.network_mode}",
+                f"总计: {len(groups)} 个有效频道" + (f" (合并了 {duplicates} 个内容相同的地址)" if duplicates else ""),
+                f"保存路径: {os.path.join(self.output_dir, filename)}",
+            ]
+            formats = set(self.export_formats) | {'txt'}
+            with ResultExporter(self.output_dir, filename, formats, comments) as exporter:
+                for group in groups:
+                    exporter.write(group, f"{group[0]['ip_version']}频道")
+            filepath = exporter.paths['txt']
             
-            self.logger.info(f"详细版本已保存到: {detail_filepath}")
+            for fmt, path in exporter.paths.items():
+                self.logger.info(f"{fmt} 已保存到: {path}")
             
             # 显示保存信息
             print(f"\n✅ 文件保存成功！")
             print(f"📁 保存目录: {self.output_dir}")
             print(f"📄 主文件: {filename}")
-            print(f"📋 详细文件: {detail_filename}")
-            print(f"📊 共保存 {len(self.found_channels)} 个有效频道")
+            for fmt, path in exporter.paths.items():
+                if fmt != 'txt':
+                    print(f"📋 {fmt}: {os.path.basename(path)}")
+            print(f"📊 共保存 {exporter.count} 个有效频道" + (f" (另有 {duplicates} 个备用地址)" if duplicates else ""))
+            print(f"🗂️ 增量结果: {os.path.basename(self.sink.filepath)}")
             print(f"🌐 网络模式: {self.network_mode}")
             
             # 显示文件完整路径
             print(f"\n🔍 文件完整路径:")
-            print(f"   {filepath}")
-            print(f"   {detail_filepath}")
+            for path in exporter.paths.values():
+                print(f"   {path}")
             
-            # 显示文件内容预览
+            # 显示文件内容预览（写入时保留的最后几行，不重新读取文件）
             print(f"\n📝 文件格式预览:")
-            with open(filepath, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                for line in lines[-5:]:  # 显示最后5行
-                    if line.strip() and not line.startswith('#'):
-                        print(f"   {line.strip()}")
+            for line in exporter.tail:
+                print(f"   {line}")
             
-            return filepath, detail_filepath
+            return filepath, exporter.paths.get('detail')
             
         except Exception as e:
             self.logger.error(f"保存结果失败: {str(e)}")
@@ -547,7 +4272,7 @@ class IDRangeScanner:
 
     def display_summary(self):
         """显示扫描摘要"""
-        if not self.found_channels:
+        if not self.sink or not len(self.sink):
             print("\n没有找到任何有效频道")
             return
         
@@ -555,33 +4280,614 @@ class IDRangeScanner:
         print("扫描结果摘要")
         print("="*80)
         
-        # 按响应时间排序
-        sorted_channels = sorted(self.found_channels, key=lambda x: x['response_time'])
+        # 按响应时间取最快的15个，不把全部结果读入内存
+        fastest = heapq.nsmallest(15, self.sink, key=lambda x: x['response_time'])
         
         print(f"{'序号':<3} {'频道名称':<20} {'IP版本':<8} {'ID':<12} {'响应时间':<8} {'状态'}")
         print("-" * 80)
         
-        for i, channel in enumerate(sorted_channels[:15], 1):  # 只显示前15个
+        for i, channel in enumerate(fastest, 1):  # 只显示前15个
             status = "✅有效"
             print(f"{i:<3} {channel['channel_name']:<20} {channel['ip_version']:<8} {channel['id']:<12} {channel['response_time']:<6} {status}")
         
-        if len(sorted_channels) > 15:
-            print(f"... 还有 {len(sorted_channels) - 15} 个频道")
+        if len(self.sink) > 15:
+            print(f"... 还有 {len(self.sink) - 15} 个频道")
         
         # 统计IP版本使用情况
-        ipv4_count = sum(1 for c in self.found_channels if c['ip_version'] == 'IPv4')
-        ipv6_count = sum(1 for c in self.found_channels if c['ip_version'] == 'IPv6')
-        dual_count = len(self.found_channels) - ipv4_count - ipv6_count
+        ipv4_count = 0
+        ipv6_count = 0
+        for c in self.sink:
+            if c['ip_version'] == 'IPv4':
+                ipv4_count += 1
+            elif c['ip_version'] == 'IPv6':
+                ipv6_count += 1
+        dual_count = len(self.sink) - ipv4_count - ipv6_count
         
         print("-" * 80)
-        print(f"总计发现: {len(self.found_channels)} 个有效频道")
+        print(f"总计发现: {len(self.sink)} 个有效频道")
+        if self.merge_duplicates:
+            groups = len(group_streams(self.sink, self.fingerprint_window))
+            if groups < len(self.sink):
+                print(f"内容去重: {groups} 路不同的流, {len(self.sink) - groups} 个地址与其它地址内容相同")
         print(f"IPv4频道: {ipv4_count} 个 | IPv6频道: {ipv6_count} 个 | 双栈频道: {dual_count} 个")
         print(f"网络模式: {self.network_mode}")
+        stats = self.connection_stats
+        if stats['new'] or stats['reused']:
+            print(f"连接复用: 新建 {stats['new']} 个, 复用 {stats['reused']} 次")
         print(f"保存目录: {self.output_dir}")
 
-def main():
+
+SHARD_CONFIG_FIELDS = ('timeout', 'max_workers', 'engine', 'per_host_limit', 'requests_per_second', 'adaptive',
+                       'network_mode', 'probe_bytes', 'max_playlist_bytes', 'drain_limit', 'origin_probing',
+                       'head_probing')
+
+
+class ShardCoordinator:
+    """
+    分片扫描的租约管理：把待扫描的ID区间切成固定大小的租约分给工作进程/节点，
+    工作者需要定期续约；超时未续约或工作进程退出的租约重新放回队列分给其它工作者
+    租约完成时通过on_complete(开始ID, 结束ID, 有效结果)合并结果，迟到的重复提交会被忽略
+    """
+
+    def __init__(self, ranges: Iterator[range], lease_size: int = 2000, lease_timeout: float = 120, on_complete=None):
+        self.lease_timeout = lease_timeout
+        self.on_complete = on_complete
+        self.pending = deque()
+        for id_range in ranges:
+            for start in range(id_range.start, id_range.stop, lease_size):
+                self.pending.append((start, min(start + lease_size, id_range.stop) - 1))
+        self.total_ids = sum(end - start + 1 for start, end in self.pending)
+        self.done_ids = 0
+        self.active = {}  # 租约ID -> [开始ID, 结束ID, 工作者, 过期时间]
+        self.reassigned = 0
+        self._lease_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return not self.pending and not self.active
+
+    def acquire(self, worker: str) -> Dict:
+        """分配一个租约；暂时没有可分配的租约时返回wait，全部完成时返回done"""
+        with self._lock:
+            self._expire()
+            if self.pending:
+                start, end = self.pending.popleft()
+                lease_id = next(self._lease_ids)
+                self.active[lease_id] = [start, end, worker, time.monotonic() + self.lease_timeout]
+                return {'lease_id': lease_id, 'start': start, 'end': end}
+            if self.active:
+                return {'wait': min(5.0, self.lease_timeout / 4)}
+            return {'done': True}
+
+    def heartbeat(self, lease_id: int) -> bool:
+        """续约，租约已被收回时返回False"""
+        with self._lock:
+            lease = self.active.get(lease_id)
+            if lease is None:
+                return False
+            lease[3] = time.monotonic() + self.lease_timeout
+            return True
+
+    def complete(self, lease_id: int, results: List[Dict]) -> bool:
+        """提交租约结果；租约已超时被收回（可能已分给其它工作者）时忽略并返回False"""
+        with self._lock:
+            lease = self.active.pop(lease_id, None)
+            if lease is None:
+                return False
+            self.done_ids += lease[1] - lease[0] + 1
+        if self.on_complete:
+            self.on_complete(lease[0], lease[1], results)
+        return True
+
+    def release_worker(self, worker: str) -> int:
+        """工作者已退出：立即收回它持有的租约，返回收回的数量"""
+        with self._lock:
+            lease_ids = [lease_id for lease_id, lease in self.active.items() if lease[2] == worker]
+            for lease_id in lease_ids:
+                self._requeue(lease_id)
+            return len(lease_ids)
+
+    def _expire(self):
+        now = time.monotonic()
+        for lease_id in [lease_id for lease_id, lease in self.active.items() if lease[3] < now]:
+            self._requeue(lease_id)
+
+    def _requeue(self, lease_id: int):
+        start, end, worker, _ = self.active.pop(lease_id)
+        self.pending.appendleft((start, end))
+        self.reassigned += 1
+        logging.getLogger(__name__).warning(f"收回租约 {start}-{end} (工作者 {worker})，重新分配")
+
+
+class ShardRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    协调服务的HTTP接口（JSON）：
+    POST /lease {worker} -> {lease_id, start, end, base_url, config} / {wait} / {done}
+    POST /heartbeat {lease_id} -> {ok}
+    POST /complete {lease_id, results} -> {ok}
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        if server.token and not secrets.compare_digest(self.headers.get('X-Shard-Token', ''), server.token):
+            return self._reply(403, {'error': 'token错误'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError
+            lease_id = int(request.get('lease_id', 0))
+        except (TypeError, ValueError):
+            return self._reply(400, {'error': '请求格式错误'})
+        coordinator = server.coordinator
+        if self.path == '/lease':
+            reply = coordinator.acquire(str(request.get('worker', self.client_address[0])))
+            if 'lease_id' in reply:
+                reply.update(base_url=server.base_url, config=server.config)
+        elif self.path == '/heartbeat':
+            reply = {'ok': coordinator.heartbeat(lease_id)}
+        elif self.path == '/complete':
+            results = request.get('results') or []
+            if not isinstance(results, list):
+                return self._reply(400, {'error': '请求格式错误'})
+            reply = {'ok': coordinator.complete(lease_id, results)}
+        else:
+            return self._reply(404, {'error': '未知接口'})
+        self._reply(200, reply)
+
+    def _reply(self, status: int, data: Dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ShardServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, coordinator: ShardCoordinator, base_url: str, config: Dict, token: str = ''):
+        self.coordinator = coordinator
+        self.base_url = base_url
+        self.config = config
+        self.token = token
+        super().__init__(address, ShardRequestHandler)
+
+
+def run_shard_worker(coordinator_url: str, worker_name: str = None, token: str = '', retries: int = 5) -> int:
+    """
+    分片工作者：向协调服务申请租约，用本地IDRangeScanner扫描租约内的ID，后台线程定期续约，
+    完成后把有效结果提交回协调服务；协调服务通知全部完成（或连续多次无法连接）时退出
+    :return: 本工作者扫描的ID数量
+    """
+    worker_name = worker_name or f"{socket.gethostname()}-{os.getpid()}"
+    coordinator_url = coordinator_url.rstrip('/')
+    client = requests.Session()
+    client.headers['X-Shard-Token'] = token
+    scanner = None
+    scanned = 0
+    failures = 0
+    
+    def call(path: str, data: Dict) -> Dict:
+        response = client.post(coordinator_url + path, json=data, timeout=30)
+        response.raise_for_status()
+        return response.json()
+    
+    while True:
+        try:
+            lease = call('/lease', {'worker': worker_name})
+            failures = 0
+        except (requests.exceptions.RequestException, ValueError) as e:
+            failures += 1
+            if failures >= retries:
+                logging.getLogger(__name__).error(f"无法连接协调服务 {coordinator_url}: {e}")
+                break
+            time.sleep(2)
+            continue
+        if lease.get('done'):
+            break
+        if 'wait' in lease:
+            time.sleep(lease['wait'])
+            continue
+        
+        if scanner is None:
+            scanner = IDRangeScanner()
+            for field, value in lease['config'].items():
+                if field in SHARD_CONFIG_FIELDS:
+                    setattr(scanner, field, value)
+            scanner.setup_network(scanner.network_mode)
+            scanner.configure_connection_pool()
+        
+        stop = threading.Event()
+        
+        def keep_alive(lease_id=lease['lease_id']):
+            while not stop.wait(10):
+                try:
+                    if not call('/heartbeat', {'lease_id': lease_id}).get('ok'):
+                        break
+                except (requests.exceptions.RequestException, ValueError):
+                    pass
+        
+        heartbeat = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat.start()
+        try:
+            results = scanner.scan_lease(lease['base_url'], lease['start'], lease['end'])
+        finally:
+            stop.set()
+        scanned += lease['end'] - lease['start'] + 1
+        try:
+            call('/complete', {'lease_id': lease['lease_id'], 'results': results})
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # 提交失败时租约会超时，由协调服务重新分配
+            scanner.logger.warning(f"提交租约 {lease['start']}-{lease['end']} 失败: {e}")
+    return scanned
+
+
+BATCH_SETTING_FIELDS = SHARD_CONFIG_FIELDS + ('sink_format', 'deep_probe', 'metrics_file', 'profile_file',
+                                              'export_formats', 'merge_duplicates', 'probe_cache')
+PROBE_CACHE_FIELDS = ('file', 'positive_ttl', 'negative_ttl')
+
+
+class BatchJob:
+    """批量任务文件中的一个扫描任务：一个URL模式和ID范围，结果单独保存"""
+
+    def __init__(self, name: str, base_url: str, start: int, end: int, network_mode: str = None,
+                 per_host_limit: int = None, output: str = None):
+        self.name = name
+        self.template = URLTemplate(base_url)
+        self.base_url = base_url
+        self.start = start
+        self.end = end
+        self.network_mode = network_mode
+        self.per_host_limit = per_host_limit
+        self.output = output or f"{INVALID_NAME_CHARS.sub('_', name)}_有效直播源.txt"
+        self.host = self.template.host
+        self.checkpoint = None
+        self.sink = None
+        self.scanned = 0
+
+    @property
+    def total(self) -> int:
+        return self.end - self.start + 1
+
+
+def load_job_file(filepath: str):
+    """
+    读取批量任务文件（.json / .toml / .yaml），返回(全局设置, 任务列表, 保存目录)
+    格式示例（JSON）：
+    {"output_dir": "结果", "settings": {"engine": "asyncio", "max_workers": 200, "timeout": 5},
+     "jobs": [{"name": "cctv", "base_url": "http://example.com/{}/index.m3u8", "start": 1, "end": 5000,
+               "network_mode": "ipv4", "per_host_limit": 8, "output": "cctv.txt"}]}
+    output_dir为相对路径时相对任务文件所在目录，默认就是任务文件所在目录
+    settings.probe_cache 为 true、缓存文件路径（相对output_dir），或 {"file": ..., "positive_ttl": 秒, "negative_ttl": 秒}
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("读取YAML任务文件需要安装PyYAML: pip install pyyaml")
+        config = yaml.safe_load(data)
+    elif extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("读取TOML任务文件需要Python 3.11或更高版本")
+        config = tomllib.loads(data.decode('utf-8-sig'))
+    else:
+        config = json.loads(data.decode('utf-8-sig'))
+    if not isinstance(config, dict) or not config.get('jobs'):
+        raise ValueError(f"任务文件中没有jobs列表: {filepath}")
+    
+    settings = config.get('settings') or {}
+    unknown = set(settings) - set(BATCH_SETTING_FIELDS)
+    if unknown:
+        raise ValueError(f"未知的设置项: {', '.join(sorted(unknown))}")
+    cache = settings.get('probe_cache')
+    if isinstance(cache, dict) and set(cache) - set(PROBE_CACHE_FIELDS):
+        raise ValueError(f"probe_cache 未知的设置项: {', '.join(sorted(set(cache) - set(PROBE_CACHE_FIELDS)))}")
+    
+    jobs = []
+    for i, item in enumerate(config['jobs'], 1):
+        name = str(item.get('name') or f"job{i}")
+        try:
+            job = BatchJob(name, item['base_url'], int(item['start']), int(item['end']),
+                           item.get('network_mode'), item.get('per_host_limit'), item.get('output'))
+        except KeyError as e:
+            raise ValueError(f"任务 {name} 缺少字段 {e}")
+        if job.start > job.end:
+            raise ValueError(f"任务 {name} 的起始ID大于结束ID")
+        if job.network_mode and job.network_mode not in HostResolver.families:
+            raise ValueError(f"任务 {name} 的网络模式无效: {job.network_mode}")
+        if any(other.base_url == job.base_url for other in jobs):
+            raise ValueError(f"任务 {name} 与其它任务的URL模式重复，请合并ID范围")
+        jobs.append(job)
+    
+    output_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), config.get('output_dir') or '')
+    return settings, jobs, output_dir
+
+
+def run_batch_jobs(job_file: str, resume: bool = True, probe_cache=None) -> int:
+    """
+    无交互批量模式入口（适合cron定时运行），返回进程退出码
+    :param probe_cache: 探测缓存设置（格式同任务文件的settings.probe_cache），给出时覆盖任务文件中的设置
+    """
+    try:
+        settings, jobs, output_dir = load_job_file(job_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ 任务文件无效: {e}")
+        return 2
+    os.makedirs(output_dir, exist_ok=True)
+    scanner = IDRangeScanner(timeout=settings.get('timeout', 5), max_workers=settings.get('max_workers', 50))
+    scanner.output_dir = output_dir
+    for field, value in settings.items():
+        if field == 'network_mode':
+            scanner.setup_network(value)
+        elif field != 'probe_cache':
+            setattr(scanner, field, value)
+    
+    cache = settings.get('probe_cache') if probe_cache is None else probe_cache
+    if cache:
+        if not isinstance(cache, dict):
+            cache = {'file': cache}
+        filepath = cache.get('file')
+        scanner.enable_probe_cache(os.path.join(output_dir, filepath) if isinstance(filepath, str) and filepath else None,
+                                   cache.get('positive_ttl', 6 * 3600), cache.get('negative_ttl', 3600))
+    try:
+        scanner.run_jobs(jobs, resume=resume)
+    finally:
+        if scanner.probe_cache:
+            scanner.probe_cache.close()
+    return 0
+
+
+class MockOriginHandler(http.server.BaseHTTPRequestHandler):
+    """模拟IPTV源站：按server.plan返回有效M3U8、404、超时或超大响应体"""
+    protocol_version = 'HTTP/1.1'
+    id_pattern = re.compile(r'/(\d+)/index\.m3u8')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        plan = self.server.plan
+        match = self.id_pattern.search(self.path)
+        kind = plan.kind(int(match.group(1))) if match else '404'
+        if plan.latency or plan.jitter:
+            time.sleep(plan.latency + plan.random.random() * plan.jitter)
+        try:
+            if kind == 'hit':
+                body = (f"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n"
+                        f"#EXTINF:-1,模拟频道{match.group(1)}\nsegment_{match.group(1)}_0.ts\n").encode('utf-8')
+                self._send(200, body, 'application/vnd.apple.mpegurl')
+            elif kind == 'timeout':
+                time.sleep(plan.stall)
+                self._send(404, b'timeout')
+            elif kind == 'oversize':
+                # 模拟直接返回.ts流的ID，支持 Range: bytes=0-N
+                size = plan.oversize_bytes
+                ranged = re.match(r'bytes=0-(\d+)$', self.headers.get('Range', ''))
+                length = min(size, int(ranged.group(1)) + 1) if ranged else size
+                self.send_response(206 if ranged else 200)
+                self.send_header('Content-Type', 'video/mp2t')
+                self.send_header('Content-Length', str(length))
+                if ranged:
+                    self.send_header('Content-Range', f'bytes 0-{length - 1}/{size}')
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                block = b'\x47' * 65536
+                for start in range(0, length, len(block)):
+                    self.wfile.write(block[:length - start])
+            else:
+                self._send(404, b'<html><body>404 Not Found</body></html>', 'text/html')
+        except (BrokenPipeError, ConnectionResetError):
+            # 扫描器读到足够的字节后会主动断开
+            self.close_connection = True
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+class MockOriginServer(http.server.ThreadingHTTPServer):
+    """模拟源站服务器，客户端主动断开不打印错误"""
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, plan: "MockOriginPlan"):
+        super().__init__(address, MockOriginHandler)
+        self.plan = plan
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class MockOriginPlan:
+    """模拟源站的ID分布：稀疏的有效ID，以及按比例注入的超时和超大响应"""
+
+    def __init__(self, hit_rate: float = 0.01, timeout_rate: float = 0.0, oversize_rate: float = 0.0,
+                 latency: float = 0.0, jitter: float = 0.0, stall: float = 10.0,
+                 oversize_bytes: int = 8 * 1024 * 1024, seed: int = 1):
+        self.hit_rate = hit_rate
+        self.timeout_rate = timeout_rate
+        self.oversize_rate = oversize_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.stall = stall
+        self.oversize_bytes = oversize_bytes
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def kind(self, id_num: int) -> str:
+        """同一个ID在每次运行中的类型固定"""
+        roll = random.Random(self.seed * 1000003 + id_num).random()
+        if roll < self.hit_rate:
+            return 'hit'
+        roll -= self.hit_rate
+        if roll < self.timeout_rate:
+            return 'timeout'
+        roll -= self.timeout_rate
+        if roll < self.oversize_rate:
+            return 'oversize'
+        return '404'
+
+
+def serve_mock_origin(plan: MockOriginPlan, port_queue, host: str = '127.0.0.1'):
+    """在子进程中运行模拟源站，端口号通过port_queue传回"""
+    server = MockOriginServer((host, 0), plan)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class ResourceSampler:
+    """后台线程定期采样本进程的常驻内存，用于统计峰值RSS"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss() -> int:
+        """当前常驻内存字节数；没有/proc时退回到getrusage的历史峰值"""
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except (ImportError, AttributeError):
+            return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_rss = self.current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_benchmark(total_ids: int = 5000, configs: List[Dict] = None, plan: MockOriginPlan = None,
+                  timeout: float = 2, output_file: str = None) -> List[Dict]:
+    """
+    离线性能测试：在本机启动模拟源站，按不同引擎和并发配置运行scan_id_range
+    统计每秒探测数、p50/p99延迟、峰值内存和每次探测的CPU时间
+    """
+    import multiprocessing
+    import tempfile
+    
+    plan = plan or MockOriginPlan(hit_rate=0.01, timeout_rate=0.001, oversize_rate=0.001,
+                                  latency=0.02, jitter=0.02, stall=timeout + 1)
+    configs = configs or [
+        {'engine': engine, 'max_workers': workers}
+        for engine in ('threads', 'asyncio') for workers in (20, 50, 100)
+    ]
+    
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_mock_origin, args=(plan, port_queue), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=10)
+    base_url = f"http://127.0.0.1:{port}/PLTV/88/224/{{}}/index.m3u8"
+    expected_hits = sum(1 for i in range(1, total_ids + 1) if plan.kind(i) == 'hit')
+    
+    print(f"\n🧪 离线性能测试: {total_ids} 个ID, 预期有效 {expected_hits} 个, 源站 {base_url}")
+    reports = []
+    try:
+        for config in configs:
+            scanner = IDRangeScanner(timeout=timeout, max_workers=config.get('max_workers', 20))
+            scanner.setup_network("ipv4")
+            for key, value in config.items():
+                setattr(scanner, key, value)
+            latencies = []
+            scanner.result_listeners.append(
+                lambda result: latencies.append(result.response_time) if result.status else None
+            )
+            level = scanner.logger.level
+            scanner.logger.setLevel(logging.WARNING)
+            
+            with tempfile.TemporaryDirectory() as tmp_dir, ResourceSampler() as sampler:
+                scanner.output_dir = tmp_dir
+                cpu_start = time.process_time()
+                wall_start = time.time()
+                sink = scanner.scan_id_range(base_url, 1, total_ids, resume=False)
+                wall = time.time() - wall_start
+                cpu = time.process_time() - cpu_start
+                found = len(sink)
+            scanner.logger.setLevel(level)
+            
+            latencies.sort()
+            report = dict(config)
+            report.update({
+                'probes': total_ids,
+                'found': found,
+                'expected': expected_hits,
+                'seconds': round(wall, 2),
+                'probes_per_sec': round(total_ids / wall, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1),
+                'cpu_ms_per_probe': round(cpu / total_ids * 1000, 3),
+                'new_connections': scanner.connection_stats['new'],
+                'reused_connections': scanner.connection_stats['reused'],
+                'head_requests': scanner.origins.counters['head'],
+            })
+            reports.append(report)
+            print(f"  {report['engine']:<8} 并发{report['max_workers']:<4} "
+                  f"{report['probes_per_sec']:>8}/s  p50 {report['p50_ms']:>7}ms  p99 {report['p99_ms']:>7}ms  "
+                  f"RSS {report['peak_rss_mb']:>6}MB  CPU {report['cpu_ms_per_probe']:>6}ms/次  "
+                  f"发现 {found}/{expected_hits}  新建连接 {report['new_connections']}")
+    finally:
+        server.terminate()
+        server.join()
+    
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"📄 测试结果已保存到: {output_file}")
+    return reports
+
+
+def main(metrics_file: str = None, profile_file: str = None, shard_processes: int = 0,
+         shard_listen: tuple = None, shard_token: str = '', export_formats: tuple = None,
+         merge_duplicates: bool = False, head_probing: bool = False):
     """主函数"""
     scanner = IDRangeScanner()
+    scanner.export_formats = export_formats or scanner.export_formats
+    scanner.merge_duplicates = merge_duplicates
+    scanner.head_probing = head_probing
+    scanner.metrics_file = metrics_file
+    scanner.profile_file = profile_file
+    scanner.shard_processes = shard_processes
+    scanner.shard_listen = shard_listen or scanner.shard_listen
+    scanner.shard_token = shard_token
     
     try:
         while True:
@@ -597,8 +4903,11 @@ def main():
             print(f"基础URL: {base_url}")
             print(f"ID范围: {start_id} - {end_id}")
             print(f"网络模式: {scanner.network_mode}")
-            print(f"线程数: {scanner.max_workers}")
+            print(f"扫描引擎: {scanner.engine}")
+            print(f"并发数: {scanner.max_workers}")
             print(f"超时时间: {scanner.timeout}秒")
+            if scanner.shard_processes:
+                print(f"分片扫描: {scanner.shard_processes} 个本机工作进程")
             print(f"预计扫描数量: {end_id - start_id + 1}")
             print(f"保存目录: {scanner.output_dir}")
             
@@ -607,11 +4916,25 @@ def main():
                 print("扫描已取消")
                 continue
             
+            # 检查是否有上次未完成的扫描
+            resume = False
+            checkpoint = scanner.find_checkpoint(base_url)
+            if checkpoint:
+                done = checkpoint.completed_count(start_id, end_id)
+                if done:
+                    print(f"\n💾 发现断点记录: 该范围已完成 {done}/{end_id - start_id + 1} 个ID")
+                    resume = input("是否从断点继续扫描？(y/n): ").strip().lower() == 'y'
+            
             print("\n开始扫描... 按 Ctrl+C 可以中断扫描")
             
             try:
                 # 开始扫描
-                found_channels = scanner.scan_id_range(base_url, start_id, end_id)
+                if scanner.shard_processes:
+                    scanner.scan_id_range_sharded(base_url, start_id, end_id, scanner.shard_processes,
+                                                  listen=scanner.shard_listen, token=scanner.shard_token,
+                                                  resume=resume)
+                else:
+                    scanner.scan_id_range(base_url, start_id, end_id, resume=resume)
                 
                 # 显示结果
                 scanner.display_summary()
@@ -621,8 +4944,10 @@ def main():
                 
             except KeyboardInterrupt:
                 print("\n扫描被用户中断")
-                if scanner.found_channels:
-                    print(f"已找到 {len(scanner.found_channels)} 个有效频道，正在保存结果...")
+                if scanner.sink:
+                    scanner.sink.close()
+                if scanner.sink and len(scanner.sink):
+                    print(f"已找到 {len(scanner.sink)} 个有效频道，正在保存结果...")
                     scanner.save_results("中断扫描_有效直播源.txt")
             
             # 询问是否继续扫描
@@ -637,4 +4962,137 @@ def main():
         print(f"程序出错: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="直播源扫描器")
+    parser.add_argument("--benchmark", action="store_true", help="使用本机模拟源站运行离线性能测试")
+    parser.add_argument("--bench-ids", type=int, default=5000, help="性能测试扫描的ID数量")
+    parser.add_argument("--bench-hit-rate", type=float, default=0.01, help="模拟源站有效ID比例")
+    parser.add_argument("--bench-latency", type=float, default=0.02, help="模拟源站固定延迟(秒)")
+    parser.add_argument("--bench-output", help="性能测试结果JSON文件")
+    parser.add_argument("--metrics", help="扫描期间定期刷新的指标文件 (.json 或 Prometheus文本格式 .prom)")
+    parser.add_argument("--profile", help="用cProfile分析扫描过程并把统计保存到该文件")
+    parser.add_argument("--validate", nargs="+", metavar="FILE", help="批量检测已有的直播源列表 (.txt / .m3u)")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads", help="批量检测使用的引擎")
+    parser.add_argument("--workers", type=int, default=50, help="批量检测并发数")
+    parser.add_argument("--timeout", type=float, default=5, help="批量检测单个地址超时(秒)")
+    parser.add_argument("--per-host", type=int, default=16, help="批量检测时单个主机的最大并发数")
+    parser.add_argument("--output-dir", help="批量检测结果保存目录，默认与原文件相同")
+    parser.add_argument("--merge", nargs="+", metavar="FILE", help="合并多个直播源列表并按规范化URL去重")
+    parser.add_argument("--merge-output", default="合并直播源.txt", help="合并结果文件 (.txt 或 .m3u)")
+    parser.add_argument("--merge-probe", action="store_true", help="合并（或索引查找 --find-output）后检测生成的列表，只探测去重后的地址")
+    parser.add_argument("--keep-params", help="去重时只比较这些查询参数，逗号分隔（默认比较全部参数）")
+    parser.add_argument("--shards", type=int, default=0, help="分片扫描：本机工作进程数（0为不分片）")
+    parser.add_argument("--listen", default="127.0.0.1:0", help="分片协调服务监听地址 HOST:PORT，其它机器参与时用 0.0.0.0:端口")
+    parser.add_argument("--worker", metavar="URL", help="作为分片工作节点连接到协调服务")
+    parser.add_argument("--token", default="", help="分片协调服务的访问令牌（监听非本机地址时未设置会自动生成）")
+    parser.add_argument("--export", default="txt,detail",
+                        help=f"保存结果的格式，逗号分隔，可选 {','.join(EXPORT_FORMATS)}")
+    parser.add_argument("--head-probe", action="store_true",
+                        help="有效率低的源站先发HEAD排除无效地址（404页面较大时省流量，但多一次往返）")
+    parser.add_argument("--merge-duplicates", action="store_true",
+                        help="保存时把内容指纹相同的地址合并为一个频道，其余作为备用地址")
+    parser.add_argument("--index", nargs="+", metavar="PATH", help="建立/增量更新直播源列表索引（文件或目录）")
+    parser.add_argument("--index-db", default="直播源索引.db", help="索引数据库文件")
+    parser.add_argument("--find", nargs="+", metavar="NAME", help="在索引中按频道名查找（前缀匹配，如 CCTV1）")
+    parser.add_argument("--find-group", help="在索引中按分组查找")
+    parser.add_argument("--find-host", help="在索引中按主机或 主机:端口 查找")
+    parser.add_argument("--find-output", help="把查找结果去重后写成列表文件 (.txt 或 .m3u)")
+    parser.add_argument("--monitor", metavar="FILE", help="健康监控：定期复查直播源列表，只输出上线/下线/变化的条目")
+    parser.add_argument("--interval", type=float, default=60, help="健康监控两轮之间最长等待秒数")
+    parser.add_argument("--cycles", type=int, default=0, help="健康监控运行轮数（0为一直运行）")
+    parser.add_argument("--min-interval", type=float, default=300, help="健康监控单个地址的最短复查间隔(秒)")
+    parser.add_argument("--max-interval", type=float, default=86400, help="健康监控稳定地址的最长复查间隔(秒)")
+    parser.add_argument("--jobs", metavar="FILE", help="无交互批量模式：运行任务文件 (.json / .toml / .yaml) 中的全部扫描任务")
+    parser.add_argument("--no-resume", action="store_true", help="批量模式忽略断点，重新扫描全部ID")
+    parser.add_argument("--cache", nargs="?", const="", metavar="FILE",
+                        help="批量检测、健康监控和批量模式使用探测结果缓存，跳过近期已检查过的地址（默认文件 .探测缓存.sqlite）")
+    parser.add_argument("--cache-ttl", type=float, default=6 * 3600, help="缓存中有效结果的有效期(秒)")
+    parser.add_argument("--cache-negative-ttl", type=float, default=3600, help="缓存中无效结果的有效期(秒)")
+    args = parser.parse_args()
+    export_formats = tuple(fmt.strip() for fmt in args.export.split(',') if fmt.strip())
+    if set(export_formats) - set(EXPORT_FORMATS):
+        parser.error(f"--export 只支持 {','.join(EXPORT_FORMATS)}")
+    
+    if args.worker:
+        run_shard_worker(args.worker, token=args.token)
+    elif args.jobs:
+        probe_cache = None
+        if args.cache is not None:
+            probe_cache = {'file': os.path.abspath(args.cache) if args.cache else None,
+                           'positive_ttl': args.cache_ttl, 'negative_ttl': args.cache_negative_ttl}
+        sys.exit(run_batch_jobs(args.jobs, resume=not args.no_resume, probe_cache=probe_cache))
+    elif args.index or args.find or args.find_group or args.find_host:
+        index = PlaylistIndex(args.index_db)
+        try:
+            if args.index:
+                started = time.time()
+                stats = index.refresh(args.index)
+                print(f"📇 索引更新: 重新索引 {stats['indexed']} 个文件 ({stats['entries']} 个条目), "
+                      f"未变化 {stats['unchanged']} 个, 移除 {stats['removed']} 个, 用时 {time.time() - started:.2f}秒")
+            if args.find or args.find_group or args.find_host:
+                matches = index.query(args.find or (), args.find_group, args.find_host)
+                if args.find_output:
+                    keep_params = None
+                    if args.keep_params is not None:
+                        keep_params = frozenset(p.strip() for p in args.keep_params.split(',') if p.strip())
+                    count = index.export(matches, args.find_output, keep_params)
+                    print(f"✅ 找到的条目已去重写入: {args.find_output} ({count} 个)")
+                else:
+                    count = 0
+                    for path, entry in matches:
+                        count += 1
+                        print(f"{os.path.basename(path)}:{entry.line_no} [{entry.group}] {entry.name},{entry.url}")
+                    print(f"共找到 {count} 个条目")
+        finally:
+            index.close()
+        if args.find_output and args.merge_probe:
+            scanner = IDRangeScanner(timeout=args.timeout, max_workers=args.workers)
+            scanner.engine = args.engine
+            scanner.per_host_limit = args.per_host
+            scanner.head_probing = args.head_probe
+            if args.cache is not None:
+                scanner.enable_probe_cache(args.cache or os.path.join(args.output_dir or '', ".探测缓存.sqlite"),
+                                           args.cache_ttl, args.cache_negative_ttl)
+            try:
+                scanner.validate_playlists([args.find_output], args.output_dir)
+            finally:
+                if scanner.probe_cache:
+                    scanner.probe_cache.close()
+    elif args.validate or args.merge or args.monitor:
+        scanner = IDRangeScanner(timeout=args.timeout, max_workers=args.workers)
+        scanner.engine = args.engine
+        scanner.per_host_limit = args.per_host
+        scanner.head_probing = args.head_probe
+        scanner.metrics_file = args.metrics
+        scanner.profile_file = args.profile
+        if args.keep_params is not None:
+            scanner.keep_params = frozenset(p.strip() for p in args.keep_params.split(',') if p.strip())
+        if args.cache is not None:
+            scanner.enable_probe_cache(args.cache or os.path.join(args.output_dir or '', ".探测缓存.sqlite"),
+                                       args.cache_ttl, args.cache_negative_ttl)
+        files = list(args.validate or [])
+        try:
+            if args.merge:
+                scanner.merge_playlists(args.merge, args.merge_output)
+                if args.merge_probe:
+                    files.append(args.merge_output)
+            if files:
+                scanner.validate_playlists(files, args.output_dir)
+            if args.monitor:
+                scanner.monitor_playlist(args.monitor, args.output_dir, args.interval, args.cycles,
+                                         args.min_interval, args.max_interval)
+        finally:
+            if scanner.probe_cache:
+                scanner.probe_cache.close()
+    elif args.benchmark:
+        run_benchmark(
+            args.bench_ids,
+            plan=MockOriginPlan(hit_rate=args.bench_hit_rate, timeout_rate=0.001, oversize_rate=0.001,
+                                latency=args.bench_latency, jitter=args.bench_latency, stall=3),
+            output_file=args.bench_output,
+        )
+    else:
+        listen_host, _, listen_port = args.listen.rpartition(':')
+        main(metrics_file=args.metrics, profile_file=args.profile, shard_processes=args.shards,
+             shard_listen=(listen_host or '127.0.0.1', int(listen_port or 0)), shard_token=args.token,
+             export_formats=export_formats, merge_duplicates=args.merge_duplicates,
+             head_probing=args.head_probe)
\ No newline at end of file